@@ -1,39 +1,29 @@
+import argparse
+import os
 import sys
+from array import array
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import permutations
 
-input = sys.argv[1]
-filename = input.split('.')
-output = '.'.join(filename[:-1]) + '.hack'  
-# catch the output filename
-
-f = open(input, 'r', encoding='ascii')  
-lines = [line for line in f.readlines() if line.strip()]  # remove space
-new_lines = []
-for line in lines:
-    new_lines.append(line.split('\n')[0])  
-    
-symbol = {'SP':0, 'LCL':1, 'ARG':2, 'THIS':3, 'THAT':4, 'R0':0, 'R1':1, 
-          'R2':2, 'R3':3, 'R4':4, 'R5':5, 'R6':6, 'R7':7, 'R8':8, 'R9':9, 
-          'R10':10, 'R11':11, 'R12':12, 'R13':13, 'R14':14, 'R15':15, 
-          'SCREEN':16384, 'KBD':24576 }
-
-RAMval = 16
-
-idx = 0
-cpy = new_lines.copy()
-for line in cpy:
-    if line[0] == '(' and line[-1]  == ')':
-        symbol[line[1:-1]] = idx   # store code chunk names into table
-        cpy.remove(line)  # remove this line
-    idx += 1  # and check next line
-#print (cpy)
-
-for line in cpy:
-    if line[0] == '@' and line[1:].isdigit() == False:
-        if line[1:] not in symbol():  # if key not added, add it to table
-            symbol[line[1:]] = RAMval 
-            RAMval = RAMval + 1
-
-result = []
+import rom
+
+# predefined symbols, every program starts from a copy of this table
+PREDEFINED = {'SP':0, 'LCL':1, 'ARG':2, 'THIS':3, 'THAT':4, 'R0':0, 'R1':1,
+              'R2':2, 'R3':3, 'R4':4, 'R5':5, 'R6':6, 'R7':7, 'R8':8, 'R9':9,
+              'R10':10, 'R11':11, 'R12':12, 'R13':13, 'R14':14, 'R15':15,
+              'SCREEN':16384, 'KBD':24576 }
+
+# first free RAM address for variables
+RAM_BASE = 16
+
+# size of the write buffer used for the output file
+BUFFER_SIZE = 1 << 16
+
+ASM_FILE = ".asm"
+
+# batches smaller than this are assembled in this process
+POOL_THRESHOLD = 16
 
 comp_0 = {'0':'101010', '1': '111111', '-1': '111010', 'D':'001100', 'A':'110000', '!D':'001101', '!A':'110001',
             '-D':'001111', '-A':'110011', 'D+1':'011111', 'A+1':'110111', 'D-1':'001110', 'A-1':'110010',
@@ -44,71 +34,281 @@ dst = {'null':'000', 'M':'001', 'D':'010', 'MD':'011', 'A':'100', 'AM':'101', 'A
 
 jmp = {'null':'000', 'JGT':'001', 'JEQ':'010', 'JGE':'011', 'JLT':'100', 'JNE':'101', 'JLE':'110', 'JMP':'111'}
 
-for line in cpy:
-    a = ''
-    comp = ''
-    dest = ''
-    jump = ''
-    if line[0] == '@':   # this is an A-instruction
-        instr = line[1:]
-        #print (instr)
-        if instr.isdigit():  # numerical variables, output 16 bit binary value directly
-            # print (bin(int(instr)))
-            bin_ins = bin(int(instr))[2:].zfill(16)
-            result.append(bin_ins)
-        else:   # otherwise search in table and convert
-            bin_ins = bin(symbol[instr])[2:].zfill(16)
-            result.append(bin_ins)
-
-
-    elif '=' in line:  # this is a C-instruction
-        dest_char = line.split('=')[0]
-        # print (dest_char)
-        comp_char = line.split('=')[1]
-        # print (comp_char)
-        if ';' in comp_char:
-            jump_char = comp_char.split(';')[1]
-            comp_char = comp_char.split(';')[0]
+
+def clean(line):
+    # drop the comment and the surrounding spaces
+    cut = line.find('//')
+    if cut != -1:
+        line = line[:cut]
+    return line.strip()
+
+
+def read_lines(path):
+    # stream the non-empty lines of the source, one at a time
+    with open(path, 'r', encoding='ascii') as f:
+        for line in f:
+            line = clean(line)
+            if line:
+                yield line
+
+
+def parse_c(line):
+    # dest=comp;jump, dest and jump are optional
+    line = ''.join(line.split())
+    dest_char, eq, comp_char = line.rpartition('=')
+    if eq:
+        # any order of the dest letters, e.g. DM for MD
+        dest_char = ''.join(sorted(dest_char, key='AMD'.find))
+    else:
+        dest_char = 'null'
+    comp_char, semi, jump_char = comp_char.partition(';')
+    if not semi:
+        jump_char = 'null'
+    if comp_char not in comp_0 and comp_char not in comp_1:
+        comp_char = swap_operands(comp_char)
+    if comp_char in comp_0:
+        comp = '0' + comp_0[comp_char]
+    elif comp_char in comp_1:
+        comp = '1' + comp_1[comp_char]
+    else:
+        raise Exception("Invalid instruction: " + line)
+    if dest_char not in dst or jump_char not in jmp:
+        raise Exception("Invalid instruction: " + line)
+    return int('111' + comp + dst[dest_char] + jmp[jump_char], 2)
+
+
+def swap_operands(comp):
+    # commutative spellings, e.g. A&D for D&A or 1+D for D+1
+    for op in '+&|':
+        left, sep, right = comp.partition(op)
+        if sep and left and right:
+            return right + op + left
+    return comp
+
+
+def build_c_table():
+    # every spelling of dest=comp;jump mapped to its 16 bit value
+    comps = set(comp_0) | set(comp_1)
+    comps |= set(swap_operands(comp) for comp in comps)
+    dests = ['']
+    for dest in dst:
+        if dest != 'null':
+            dests += sorted(set(''.join(p) for p in permutations(dest)))
+    table = {}
+    for comp in comps:
+        for dest in dests:
+            for jump in jmp:
+                line = comp
+                if dest:
+                    line = dest + '=' + line
+                if jump != 'null':
+                    line = line + ';' + jump
+                table[line] = parse_c(line)
+    return table
+
+
+# filled once at import, unusual spellings are added the first time they are seen
+C_TABLE = build_c_table()
+
+
+def encode_c(line):
+    # single lookup for the usual spellings, the slow path caches its answer
+    code = C_TABLE.get(line)
+    if code is None:
+        code = C_TABLE[line] = parse_c(line)
+    return code
+
+
+def write_hack(words, path):
+    # one 16 character binary string per line, through a buffered writer
+    with open(path, 'w', buffering=BUFFER_SIZE) as out:
+        for word in words:
+            out.write('{:016b}\n'.format(word))
+
+
+def write_rom(words, path):
+    # the output format follows the file extension
+    if path.endswith(rom.HACKB_FILE):
+        rom.write_hackb(words, path)
+    else:
+        write_hack(words, path)
+
+
+class Assembler:
+    """
+    Translates Hack assembly into 16 bit words. One instance can assemble any number of programs,
+    the symbol table of the last one is kept for tools that need label addresses.
+    """
+
+    def __init__(self):
+        self.symbol = dict(PREDEFINED)
+        self.labels = {}
+        self.variables = {}
+
+    def reset(self):
+        """
+        Starts a new program from the predefined symbols
+        :return:
+        """
+        self.symbol = dict(PREDEFINED)
+        self.labels = {}
+        self.variables = {}
+
+    def first_pass(self, lines):
+        """
+        Stores code chunk names into the table, labels do not take a ROM slot
+        :param lines: cleaned source lines
+        :return: number of instructions
+        """
+        symbol = self.symbol
+        labels = self.labels
+        idx = 0
+        for line in lines:
+            if line[0] == '(':
+                symbol[line[1:-1]] = labels[line[1:-1]] = idx
+            else:
+                idx += 1
+        return idx
+
+    def second_pass(self, lines):
+        """
+        Yields the 16 bit value of every instruction, variables are allocated on first use
+        :param lines: cleaned source lines
+        :return:
+        """
+        symbol = self.symbol
+        table = C_TABLE
+        RAMval = RAM_BASE
+        for line in lines:
+            head = line[0]
+            if head == '(':
+                continue
+            if head == '@':   # this is an A-instruction
+                instr = line[1:]
+                if instr.isdigit():  # numerical variables, output value directly
+                    yield int(instr)
+                else:   # otherwise search in table and convert
+                    value = symbol.get(instr)
+                    if value is None:  # if key not added, add it to table
+                        value = symbol[instr] = self.variables[instr] = RAMval
+                        RAMval += 1
+                    yield value
+            else:   # this is a C-instruction
+                code = table.get(line)
+                if code is None:
+                    code = encode_c(line)
+                yield code
+
+    def assemble(self, source_lines):
+        """
+        Assembles a program held in memory
+        :param source_lines: lines of Hack assembly, comments and blank lines allowed
+        :return: array of unsigned 16 bit words
+        """
+        self.reset()
+        lines = [line for line in map(clean, source_lines) if line]
+        self.first_pass(lines)
+        return array('H', self.second_pass(lines))
+
+    def assemble_file(self, path, output=None):
+        """
+        Assembles a file in two streaming passes, nothing but the symbol table is kept in memory
+        :param path: .asm file name
+        :param output: .hack or .hackb file name, defaults to the .hack file next to the source
+        :return: output file name
+        """
+        if output is None:
+            output = output_name(path, rom.HACK_FILE)
+        self.reset()
+        self.first_pass(read_lines(path))
+        write_rom(self.second_pass(read_lines(path)), output)
+        return output
+
+
+def assemble(source_lines):
+    """
+    Assembles a program held in memory
+    :param source_lines: lines of Hack assembly
+    :return: array of unsigned 16 bit words
+    """
+    return Assembler().assemble(source_lines)
+
+
+def output_name(path, extension):
+    # catch the output filename
+    filename = path.split('.')
+    return '.'.join(filename[:-1]) + extension
+
+
+def find_sources(paths):
+    # files are taken as given, directories contribute their .asm files
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            for filename in sorted(os.listdir(path)):
+                if filename.endswith(ASM_FILE):
+                    sources.append(os.path.join(path, filename))
+        elif os.path.isfile(path):
+            sources.append(path)
         else:
-            jump_char = 'null'
-        # print (dest_char, comp_char, jump_char)
-        if comp_char in comp_0.keys():
-            comp = comp_0[comp_char]
-            a = '0'
-        elif comp_char in comp_1.keys():
-            comp = comp_1[comp_char]
-            a = '1'
-        # print (a+comp)
-        dest = dst[dest_char]
-        jump = jmp[jump_char]
-        result.append('111' + a + comp + dest + jump)
-
-    elif ';' in line:   # if this is a jump instruction
-        dest_char = 'null'  # with no '=', dest will be null
-        comp_char = line.split(';')[0]
-        jump_char = line.split(';')[1]
-        if comp_char in comp_0.keys():
-            comp = comp_0[comp_char]
-            a = '0'
-        elif comp_char in comp_1.keys():
-            comp = comp_1[comp_char]
-            a = '1'
-        dest = dst[dest_char]
-        jump = jmp[jump_char]
-        result.append('111' + a + comp + dest + jump)
-
-
-#print(cpy[137])
-#print(table['sys.init'])
-# print (len(new_lines))
-# print(len(new_lines))
-# print (len(result))
-
-msg = ""
-
-for item in result:
-    msg = msg + item + "\n"  # combine the results into one string
-
-# write string into output.hack
-out_file = open(output, 'w')
-out_file.write(msg)
\ No newline at end of file
+            raise Exception("Not a valid file/path: " + path)
+    return sources
+
+
+def _assemble_job(job):
+    # runs in a pool worker, every worker keeps one assembler around
+    global _worker
+    if _worker is None:
+        _worker = Assembler()
+    path, output, optimize, trust_sp = job
+    if not optimize:
+        return _worker.assemble_file(path, output), None
+    import optimizer
+    report = Counter()
+    with open(path, 'r', encoding='ascii') as f:
+        lines = optimizer.optimize(f, report, trust_sp)
+    write_rom(_worker.assemble(lines), output)
+    return output, report
+
+
+_worker = None
+
+
+def assemble_batch(sources, extension=rom.HACK_FILE, jobs=1, optimize=False, trust_sp=False):
+    """
+    Assembles many files in this process, large batches are spread over a process pool
+    :param sources: .asm file names
+    :param extension: .hack or .hackb
+    :param jobs: number of worker processes
+    :param optimize: run the optimizer passes before encoding
+    :param trust_sp: let the optimizer assume the VM convention that SP never points at R0..R15
+    :return: (output file name, optimizer report or None) for every source
+    """
+    work = [(path, output_name(path, extension), optimize, trust_sp) for path in sources]
+    if jobs > 1 and len(work) >= POOL_THRESHOLD:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            return list(pool.map(_assemble_job, work, chunksize=max(1, len(work) // (4 * jobs))))
+    return [_assemble_job(job) for job in work]
+
+
+def main(argv):
+    arg_parser = argparse.ArgumentParser(description="Hack assembler")
+    arg_parser.add_argument('paths', nargs='+', help=".asm files or directories of .asm files")
+    arg_parser.add_argument('-b', action='store_true', help="write the packed binary .hackb format")
+    arg_parser.add_argument('-j', type=int, default=os.cpu_count() or 1, help="worker processes for large batches")
+    arg_parser.add_argument('-O', action='store_true', help="optimize the assembly before encoding it")
+    arg_parser.add_argument('-sp', action='store_true',
+                            help="with -O, assume SP never points at R0..R15, for VM translator output only")
+    args = arg_parser.parse_args(argv)
+    extension = rom.HACKB_FILE if args.b else rom.HACK_FILE
+    results = assemble_batch(find_sources(args.paths), extension, args.j, args.O, args.sp)
+    if args.O:
+        total = Counter()
+        for output, report in results:
+            total.update(report)
+        for name, removed in total.most_common():
+            print('{n:<14}{r:>8}'.format(n=name, r=removed))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
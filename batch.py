@@ -0,0 +1,164 @@
+"""
+Runs one Hack ROM on many RAM images at once. The registers of all machines are NumPy vectors
+and RAM is an (N, 32768) array, machines at the same PC execute the instruction together.
+
+python batch.py filename.hack rams.npy [out.npy] [cycles]
+rams.npy holds one initial RAM image per row, the final images are written to out.npy
+"""
+import sys
+
+import numpy as np
+
+import emulator
+import rom
+
+
+def halt_addresses(words):
+    """
+    ROM addresses at which a machine counts as halted: past the end of the program, and the
+    self loops the emulator stops at
+    :param words: sequence of unsigned 16 bit instructions
+    :return: bool array of ROM_SIZE entries
+    """
+    halts = np.zeros(emulator.ROM_SIZE, dtype=bool)
+    halts[len(words):] = True
+    halts[emulator.self_loops(words)] = True
+    return halts
+
+
+def alu(control, x, y):
+    """
+    The Hack ALU over vectors, control is the same for every lane
+    :param control: zx nx zy ny f no as a 6 bit number
+    :param x: D values
+    :param y: A or M values
+    :return: int32 vector of signed 16 bit results
+    """
+    if control & 32:
+        x = np.zeros_like(x)
+    if control & 16:
+        x = ~x
+    if control & 8:
+        y = np.zeros_like(y)
+    if control & 4:
+        y = ~y
+    out = x + y if control & 2 else x & y
+    if control & 1:
+        out = ~out
+    return ((out + 0x8000) & 0xFFFF) - 0x8000
+
+
+class BatchEmulator:
+    """
+    N Hack machines sharing one ROM. PC, A and D are int32 vectors, RAM is int16 with one row
+    per machine
+    """
+
+    def __init__(self, words, rams):
+        """
+        :param words: sequence of unsigned 16 bit instructions
+        :param rams: (N, k) array of initial RAM images, k <= 32768, missing words are zero
+        """
+        if len(words) > emulator.ROM_SIZE:
+            raise Exception("ROM is larger than 32K words")
+        rams = np.asarray(rams)
+        if rams.ndim != 2 or rams.shape[1] > emulator.RAM_SIZE:
+            raise Exception("RAM images must be an (N, 32768) array")
+        self.rom = words
+        self.code = [emulator.decode(word) for word in words]
+        self.controls = [(word >> 6) & 63 for word in words]
+        self.halts = halt_addresses(words)
+        count = rams.shape[0]
+        self.ram = np.zeros((count, emulator.RAM_SIZE), dtype=np.int16)
+        # unsigned images are taken bit for bit
+        self.ram[:, :rams.shape[1]] = rams.astype(np.uint16).view(np.int16) if rams.dtype.kind == 'u' else rams
+        self.pc = np.zeros(count, dtype=np.int32)
+        self.a = np.zeros(count, dtype=np.int32)
+        self.d = np.zeros(count, dtype=np.int32)
+        self.cycles = np.zeros(count, dtype=np.int64)
+        self.halted = self.halts[self.pc]
+
+    def step(self, pc, lanes):
+        """
+        Executes the instruction at pc on the given machines
+        :param pc: ROM address
+        :param lanes: indices of the machines at pc
+        :return:
+        """
+        ins = self.code[pc]
+        if ins.__class__ is int:
+            self.a[lanes] = ins
+            self.pc[lanes] = pc + 1
+            return
+        _, use_m, dest, jump = ins
+        a = self.a[lanes]
+        address = a & 32767
+        y = self.ram[lanes, address].astype(np.int32) if use_m else a
+        value = alu(self.controls[pc], self.d[lanes], y)
+        if dest & emulator.DEST_M:
+            self.ram[lanes, address] = value
+        if dest & emulator.DEST_D:
+            self.d[lanes] = value
+        if dest & emulator.DEST_A:
+            self.a[lanes] = value
+        if jump == 7:
+            self.pc[lanes] = address
+        elif jump:
+            taken = np.zeros(len(value), dtype=bool)
+            if jump & emulator.JUMP_LT:
+                taken |= value < 0
+            if jump & emulator.JUMP_EQ:
+                taken |= value == 0
+            if jump & emulator.JUMP_GT:
+                taken |= value > 0
+            self.pc[lanes] = np.where(taken, address, pc + 1)
+        else:
+            self.pc[lanes] = pc + 1
+
+    def run(self, cycles):
+        """
+        Steps every running machine until all of them halt or the cycle budget is used up
+        :param cycles: maximum number of steps
+        :return: number of steps taken
+        """
+        for n in range(cycles):
+            running = np.flatnonzero(~self.halted)
+            if not len(running):
+                return n
+            pcs = self.pc[running]
+            first = pcs[0]
+            if (pcs == first).all():
+                # the usual case, every machine at the same instruction
+                self.step(int(first), running)
+            else:
+                order = np.argsort(pcs, kind='stable')
+                pcs = pcs[order]
+                starts = np.flatnonzero(np.diff(pcs)) + 1
+                for group in np.split(running[order], starts):
+                    self.step(int(self.pc[group[0]]), group)
+            self.cycles[running] += 1
+            self.halted[running] = self.halts[self.pc[running]]
+        return cycles
+
+
+def run_batch(words, rams, cycles=10 ** 6):
+    """
+    Runs a ROM from every initial RAM image until all machines halt
+    :param words: sequence of unsigned 16 bit instructions
+    :param rams: (N, k) array of initial RAM images
+    :param cycles: maximum number of steps
+    :return: (N, 32768) int16 array of final RAM images
+    """
+    machines = BatchEmulator(words, rams)
+    machines.run(cycles)
+    return machines.ram
+
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('-')]
+    machines = BatchEmulator(rom.load_rom(args[0]), np.load(args[1]))
+    steps = machines.run(int(args[3]) if len(args) > 3 else 10 ** 6)
+    print('{n} machines  {s} steps  {h} halted'.format(
+        n=len(machines.pc), s=steps, h=int(machines.halted.sum())))
+    if len(args) > 2:
+        np.save(args[2], machines.ram)
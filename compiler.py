@@ -1,6 +1,8 @@
 import sys
 import os
 
+import vmb
+
 keywords = ['class', 'constructor', 'function', 'method', 'field', 'static', 'var', 'int', 'char', 'boolean', 'void', 
             'true', 'false', 'null', 'this', 'let', 'do', 'if', 'else', 'while', 'return']
 symbols = ['(', ')', '[', ']', '{', '}', ',', ';', '=', '.', '+', '-', '*', '/', '&', '|', '~', '<', '>']
@@ -223,7 +225,10 @@ class Compiler:
     def __init__(self, tokenizer, output_file):
         self.token = tokenizer
         self.symbol_table = SymbolTable()
-        self.vmwriter = VMWriter(output_file)
+        if output_file.endswith(vmb.VMB_FILE):
+            self.vmwriter = vmb.VMBWriter(output_file)
+        else:
+            self.vmwriter = VMWriter(output_file)
         self.ops_stack = Stack()
 
         #if label
@@ -733,7 +738,8 @@ file = new_code
 if os.path.isfile(path):
     if path.endswith(".jack"):
         jackfile = path.split("/")[-1]
-        vm_file = jackfile[0:jackfile.find(".")] + ".vm"
+        # -b writes binary VM code
+        vm_file = jackfile[0:jackfile.find(".")] + (vmb.VMB_FILE if '-b' in sys.argv else ".vm")
         vm_file = os.path.join(os.path.dirname(path), vm_file)
         tokenizer = Tokenizer(file)
         Compiler(tokenizer, vm_file) 
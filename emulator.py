@@ -0,0 +1,566 @@
+"""
+Hack CPU emulator. Every ROM word is decoded once into a dispatch table, RAM is an array of
+signed 16 bit words
+
+python emulator.py filename.hack [cycles]
+runs the program and prints the registers, -bench compares against decoding on every cycle
+"""
+import hashlib
+import struct
+import sys
+import time
+from array import array
+
+import assembler
+import rom
+
+RAM_SIZE = 32768
+ROM_SIZE = 32768
+
+# A-instructions are decoded to their value, C-instructions to (alu, reads M, dest bits, jump bits)
+DEST_M = 1
+DEST_D = 2
+DEST_A = 4
+JUMP_LT = 4
+JUMP_EQ = 2
+JUMP_GT = 1
+
+# checkpoint header: magic, version, flags (1 = halted), pc, a, d, cycles, ROM SHA-1, RAM follows
+CHECKPOINT_MAGIC = b'HCKP'
+CHECKPOINT_VERSION = 1
+CHECKPOINT = struct.Struct('<4sHHHhhQ20s')
+
+# the documented comps, x is D and y is A or M, results are wrapped to 16 bits
+ALU = {'0': lambda x, y: 0, '1': lambda x, y: 1, '-1': lambda x, y: -1,
+       'D': lambda x, y: x, 'A': lambda x, y: y, '!D': lambda x, y: ~x, '!A': lambda x, y: ~y,
+       '-D': lambda x, y: (32768 - x & 65535) - 32768, '-A': lambda x, y: (32768 - y & 65535) - 32768,
+       'D+1': lambda x, y: (x + 32769 & 65535) - 32768, 'A+1': lambda x, y: (y + 32769 & 65535) - 32768,
+       'D-1': lambda x, y: (x + 32767 & 65535) - 32768, 'A-1': lambda x, y: (y + 32767 & 65535) - 32768,
+       'D+A': lambda x, y: (x + y + 32768 & 65535) - 32768, 'D-A': lambda x, y: (x - y + 32768 & 65535) - 32768,
+       'A-D': lambda x, y: (y - x + 32768 & 65535) - 32768, 'D&A': lambda x, y: x & y, 'D|A': lambda x, y: x | y}
+
+
+def wrap(value):
+    # 16 bit two's complement
+    return ((value + 0x8000) & 0xFFFF) - 0x8000
+
+
+def alu(control, x, y):
+    """
+    The Hack ALU, used for the undocumented comp bits and by the naive loop
+    :param control: zx nx zy ny f no as a 6 bit number
+    :param x: D
+    :param y: A or M
+    :return: signed 16 bit result
+    """
+    if control & 32:
+        x = 0
+    if control & 16:
+        x = ~x
+    if control & 8:
+        y = 0
+    if control & 4:
+        y = ~y
+    out = x + y if control & 2 else x & y
+    if control & 1:
+        out = ~out
+    return wrap(out)
+
+
+def _alu_table():
+    # 6 bit control -> function, the documented ones are written out for speed
+    table = {}
+    for comp, bits in assembler.comp_0.items():
+        if comp in ALU:
+            table[int(bits, 2)] = ALU[comp]
+    for control in range(64):
+        if control not in table:
+            table[control] = lambda x, y, control=control: alu(control, x, y)
+    return table
+
+
+ALU_TABLE = _alu_table()
+
+
+def decode(word):
+    """
+    Decodes one instruction
+    :param word: unsigned 16 bit instruction
+    :return: int for an A-instruction, (alu, reads M, dest bits, jump bits) for a C-instruction
+    """
+    if not word & 0x8000:
+        return word
+    return ALU_TABLE[(word >> 6) & 63], bool(word & 0x1000), (word >> 3) & 7, word & 7
+
+
+def self_loops(words):
+    """
+    Addresses p holding "@p" followed by an unconditional jump that writes nothing, the usual
+    (END) @END 0;JMP. A machine that gets there never leaves
+    :param words: sequence of unsigned 16 bit instructions
+    :return: list of addresses
+    """
+    loops = []
+    for p in range(len(words) - 1):
+        jump = words[p + 1]
+        if words[p] == p and jump & 0x8000 and jump & 7 == 7 and not (jump >> 3) & 7:
+            loops.append(p)
+    return loops
+
+
+# comps whose effect on D is a constant step, by control bits: (uses A, sign of A, constant)
+STEPS = {int(assembler.comp_0[comp], 2): step for comp, step in
+         (('D', (False, 0, 0)), ('D+1', (False, 0, 1)), ('D-1', (False, 0, -1)),
+          ('D+A', (True, 1, 0)), ('D-A', (True, -1, 0)))}
+
+# conditions a counted loop can use: jump bits -> (continues while D is above (1) or below (-1), bound)
+BOUNDS = {1: (1, 0), 3: (1, -1), 4: (-1, 0), 6: (-1, 1)}
+
+
+class Loop:
+    """
+    Backward jump region that never writes RAM. Between two visits of the head the machine only
+    changes A and D, so equal registers at the head mean it spins forever. When D moves by a
+    constant step per pass and the jump at the end tests it, the pass count is computed instead
+    """
+
+    def __init__(self, head, end):
+        self.head = head
+        self.end = end
+        self.length = end - head + 1
+        # set for counted loops: D step per pass, jump bits, A after a pass
+        self.step = None
+        self.jump = 0
+        self.after = 0
+        self.misses = 0
+
+    def count(self, d):
+        """
+        Passes until the jump at the end falls through
+        :param d: D at the head
+        :return: number of passes, None when D would wrap or never reach the bound
+        """
+        step, jump = self.step, self.jump
+        if jump == 5:
+            # D != 0 with a step of one reaches 0 going round the 16 bit range
+            if step not in (1, -1):
+                return None
+            return (-d * step) % 65536 or 65536
+        direction, bound = BOUNDS[jump]
+        if direction * step >= 0:
+            return None
+        if direction > 0:
+            passes = max(1, -(-(d - bound) // -step))
+        else:
+            passes = max(1, -(-(bound - d) // step))
+        if not -32768 <= d + passes * step <= 32767:
+            return None
+        return passes
+
+
+def counted(words, loop):
+    """
+    Fills the step of a straight line loop whose only effect on D is a constant step and whose
+    final jump tests the new D
+    :param words: sequence of unsigned 16 bit instructions
+    :param loop: Loop to analyse
+    :return:
+    """
+    a = None
+    d = 0
+    for address in range(loop.head, loop.end + 1):
+        word = words[address]
+        if not word & 0x8000:
+            a = word
+            continue
+        jump = word & 7
+        if jump and address != loop.end:
+            return
+        dest = (word >> 3) & 7
+        step = STEPS.get((word >> 6) & 63)
+        if step is None or word & 0x1000 or (step[0] and a is None):
+            if dest & (DEST_A | DEST_D) or address == loop.end:
+                return
+            continue
+        value = d + step[2] + (step[1] * wrap(a) if step[0] else 0)
+        if dest & DEST_D:
+            d = value
+        if dest & DEST_A:
+            return
+        if address == loop.end:
+            if d != value or not wrap(d) or jump not in BOUNDS and jump != 5:
+                return
+            loop.step, loop.jump, loop.after = wrap(d), jump, a
+
+
+def find_loops(words):
+    """
+    Write-free loops: a backward jump to a constant head with no M destination in between
+    :param words: sequence of unsigned 16 bit instructions
+    :return: {head address: Loop}, the longest region wins for a shared head
+    """
+    loops = {}
+    for end in range(1, len(words)):
+        word = words[end]
+        head = words[end - 1]
+        if not word & 0x8000 or not word & 7 or head & 0x8000 or head >= end:
+            continue
+        if head in loops and loops[head].end >= end:
+            continue
+        for address in range(head, end + 1):
+            if words[address] & 0x8008 == 0x8008:
+                break
+        else:
+            loop = loops[head] = Loop(head, end)
+            counted(words, loop)
+    return loops
+
+
+# stands in the predecoded code where a machine halts
+HALT = 'halt'
+
+# passes at a loop head without a repeat before its marker is taken out
+SPIN_TRIES = 8
+
+
+class Emulator:
+    """
+    Runs a Hack ROM. PC, A and D are plain ints, A and D hold signed 16 bit values
+    """
+
+    def __init__(self, words):
+        """
+        Decodes the ROM and clears RAM
+        :param words: sequence of unsigned 16 bit instructions
+        """
+        if len(words) > ROM_SIZE:
+            raise Exception("ROM is larger than 32K words")
+        self.rom = words
+        self.size = len(words)
+        self.code = [decode(word) for word in words]
+        # the same with markers in front of halts and write-free loops, run stops there, and with
+        # the halt markers only for the runs that look at every cycle
+        self.fast = list(self.code)
+        self.halting = list(self.code)
+        self.loops = find_loops(words)
+        for head in self.loops:
+            self.fast[head] = self.loops[head]
+        for p in self_loops(words):
+            self.fast[p] = self.halting[p] = HALT
+        self.ram = array('h', bytes(2 * RAM_SIZE))
+        self.digest = None
+        self.reset()
+
+    @staticmethod
+    def load(path):
+        """
+        Emulator for a .hack or .hackb file
+        :param path:
+        :return:
+        """
+        return Emulator(rom.load_rom(path))
+
+    def reset(self):
+        """
+        Starts again from address 0, RAM is left as it is
+        :return:
+        """
+        self.pc = 0
+        self.a = 0
+        self.d = 0
+        self.cycles = 0
+        self.halted = self.size == 0
+
+    def rom_digest(self):
+        """
+        SHA-1 of the ROM, computed on first use
+        :return: 20 bytes
+        """
+        if self.digest is None:
+            self.digest = hashlib.sha1(array('H', self.rom).tobytes()).digest()
+        return self.digest
+
+    def snapshot(self):
+        """
+        Registers and RAM in one buffer, RAM is copied once
+        :return: bytes of the checkpoint header followed by the little-endian RAM words
+        """
+        header = CHECKPOINT.pack(CHECKPOINT_MAGIC, CHECKPOINT_VERSION, int(self.halted), self.pc, self.a, self.d,
+                                 self.cycles, self.rom_digest())
+        if sys.byteorder == 'big':
+            ram = array('h', self.ram)
+            ram.byteswap()
+            return header + ram.tobytes()
+        return header + self.ram.tobytes()
+
+    def restore(self, data):
+        """
+        Goes back to a snapshot of the same ROM. RAM is overwritten in place, views of it stay valid
+        :param data: bytes from snapshot
+        :return:
+        """
+        magic, version, flags, pc, a, d, cycles, digest = CHECKPOINT.unpack_from(data)
+        if magic != CHECKPOINT_MAGIC or version != CHECKPOINT_VERSION:
+            raise Exception("Not an emulator checkpoint")
+        if digest != self.rom_digest():
+            raise Exception("Checkpoint was taken with a different ROM")
+        if len(data) != CHECKPOINT.size + 2 * RAM_SIZE:
+            raise Exception("Truncated emulator checkpoint")
+        memoryview(self.ram).cast('B')[:] = memoryview(data)[CHECKPOINT.size:]
+        if sys.byteorder == 'big':
+            self.ram.byteswap()
+        self.pc, self.a, self.d, self.cycles, self.halted = pc, a, d, cycles, bool(flags & 1)
+
+    def save_checkpoint(self, path):
+        """
+        Writes a snapshot to a file
+        :param path: output file name
+        :return:
+        """
+        with open(path, 'wb') as out:
+            out.write(self.snapshot())
+
+    def load_checkpoint(self, path):
+        """
+        Restores a snapshot written by save_checkpoint
+        :param path: checkpoint file name
+        :return:
+        """
+        with open(path, 'rb') as f:
+            self.restore(f.read())
+
+    def run(self, cycles):
+        """
+        Executes instructions until the PC leaves the ROM or reaches a self loop, or the cycle
+        budget is used up. Write-free loops are skipped ahead with the same final state
+        :param cycles: maximum number of instructions
+        :return: number of instructions executed
+        """
+        n = self.interpret(cycles)
+        while n < cycles and not self.halted:
+            n += self.at_marker(cycles - n)
+            if n < cycles and not self.halted:
+                n += self.interpret(cycles - n)
+        return n
+
+    def at_marker(self, cycles):
+        """
+        Handles the marker at the PC: halts, or runs a loop ahead
+        :param cycles: remaining budget
+        :return: number of instructions executed
+        """
+        loop = self.fast[self.pc]
+        if loop is HALT:
+            self.halted = True
+            return 0
+        if loop.step is not None:
+            passes = loop.count(self.d)
+            if passes is not None:
+                if passes * loop.length > cycles:
+                    passes, pc = cycles // loop.length, loop.head
+                else:
+                    pc = loop.end + 1
+                if passes:
+                    self.pc, self.a, self.d = pc, loop.after, wrap(self.d + passes * loop.step)
+                    self.cycles += passes * loop.length
+                    self.halted = pc >= self.size
+                    return passes * loop.length
+        n = self.spin(loop, cycles)
+        if self.pc == loop.head and n < cycles:
+            a, d = self.a, self.d
+            period = self.spin(loop, cycles - n)
+            if self.pc == loop.head and (self.a, self.d) == (a, d):
+                # nothing but A and D changed and they are back, skip every whole period
+                skipped = (cycles - n) // period * period - period
+                self.cycles += skipped
+                n += period + skipped
+            else:
+                n += period
+                loop.misses += 1
+                if loop.misses == SPIN_TRIES:
+                    self.fast[loop.head] = self.code[loop.head]
+        return n
+
+    def spin(self, loop, cycles):
+        """
+        One pass through a write-free loop, from its head until it gets back there, leaves or
+        halts in a halt loop inside it
+        :param loop: Loop, the PC is at its head
+        :param cycles: maximum number of instructions
+        :return: number of instructions executed
+        """
+        head, end = loop.head, loop.end
+
+        def leaves(pc, a, next_pc):
+            return next_pc == head or not head < next_pc <= end
+
+        return self.execute(cycles, self.halting, leaves)
+
+    def execute(self, cycles, code, hook=None):
+        """
+        The interpreter loop every run goes through. Stops when the PC leaves the ROM, in front of
+        a marker of code, a halt marker setting halted, or after an instruction the hook returns
+        True for
+        :param cycles: maximum number of instructions
+        :param code: self.fast or self.halting
+        :param hook: function of the executed address, the A it addressed RAM with and the next PC,
+        called after every instruction, registers are only up to date in RAM
+        :return: number of instructions executed
+        """
+        ram = self.ram
+        size = self.size
+        pc, a, d = self.pc, self.a, self.d
+        n = 0
+        for n in range(cycles):
+            if pc >= size:
+                break
+            ins = code[pc]
+            used = a
+            if ins.__class__ is int:
+                a = ins
+                next_pc = pc + 1
+            elif ins.__class__ is tuple:
+                fn, use_m, dest, jump = ins
+                value = fn(d, ram[a] if use_m else a)
+                if dest:
+                    if dest & DEST_M:
+                        ram[a] = value
+                    if dest & DEST_D:
+                        d = value
+                    if dest & DEST_A:
+                        a = value
+                if jump and jump & (JUMP_LT if value < 0 else JUMP_EQ if value == 0 else JUMP_GT):
+                    next_pc = used & 32767
+                else:
+                    next_pc = pc + 1
+            else:
+                if ins is HALT:
+                    self.halted = True
+                break
+            if hook is not None and hook(pc, used, next_pc):
+                pc = next_pc
+                n += 1
+                break
+            pc = next_pc
+        else:
+            n = cycles
+        if pc >= size:
+            # off the end of the ROM, halted by the step that left it
+            self.halted = True
+        self.pc, self.a, self.d = pc, a, d
+        self.cycles += n
+        return n
+
+    def interpret(self, cycles):
+        """
+        Runs until a marker of the fast code
+        :param cycles: maximum number of instructions
+        :return: number of instructions executed
+        """
+        return self.execute(cycles, self.fast)
+
+    def run_profiled(self, cycles, hits):
+        """
+        Same as run without skipping loops ahead, also counts how often every ROM address is executed
+        :param cycles: maximum number of instructions
+        :param hits: list of ROM_SIZE counters, incremented in place
+        :return: number of instructions executed
+        """
+
+        def count(pc, a, next_pc):
+            hits[pc] += 1
+
+        return self.execute(cycles, self.halting, count)
+
+    def run_hooked(self, cycles, targets, hook):
+        """
+        Same as run without skipping loops ahead, calls hook(pc, executed) whenever a taken jump
+        lands on an address in targets. The hook may change targets, registers are only up to
+        date in RAM
+        :param cycles: maximum number of instructions
+        :param targets: set of ROM addresses
+        :param hook: function of the new pc and the instructions executed so far in this call
+        :return: number of instructions executed
+        """
+        executed = 0
+
+        def landed(pc, a, next_pc):
+            nonlocal executed
+            executed += 1
+            if next_pc in targets and next_pc != pc + 1:
+                hook(next_pc, executed)
+
+        return self.execute(cycles, self.halting, landed)
+
+
+def run_naive(emulator, cycles):
+    """
+    Reference loop that decodes the instruction bits on every cycle, kept for the benchmark
+    :param emulator: Emulator whose ROM and RAM are used
+    :param cycles: maximum number of instructions
+    :return: number of instructions executed
+    """
+    words = emulator.rom
+    ram = emulator.ram
+    pc, a, d = emulator.pc, emulator.a, emulator.d
+    n = 0
+    while n < cycles and pc < len(words):
+        word = words[pc]
+        n += 1
+        if not word & 0x8000:
+            a = word
+            pc += 1
+            continue
+        y = ram[a] if word & 0x1000 else a
+        value = alu((word >> 6) & 63, d, y)
+        target = a
+        if word & 0x08:
+            ram[a] = value
+        if word & 0x10:
+            d = value
+        if word & 0x20:
+            a = value
+        jump = word & 7
+        if (jump & 4 and value < 0) or (jump & 2 and value == 0) or (jump & 1 and value > 0):
+            pc = target & 32767
+        else:
+            pc += 1
+    emulator.pc, emulator.a, emulator.d = pc, a, d
+    emulator.cycles += n
+    return n
+
+
+def benchmark(words, cycles):
+    """
+    Instructions per second of the predecoded loop against the naive one
+    :param words: ROM
+    :param cycles: instructions to run with each loop
+    :return: (predecoded, naive) instructions per second
+    """
+    results = []
+    for loop in (Emulator.run, run_naive):
+        emulator = Emulator(words)
+        start = time.perf_counter()
+        executed = loop(emulator, cycles)
+        results.append(executed / (time.perf_counter() - start))
+    return tuple(results)
+
+
+if __name__ == '__main__':
+    path = sys.argv[1]
+    args = [arg for arg in sys.argv[2:] if not arg.startswith('-')]
+    cycles = int(args[0]) if args else 10 ** 7
+    if '-bench' in sys.argv:
+        fast, naive = benchmark(rom.load_rom(path), cycles)
+        print('predecoded {f:,.0f} instructions/s'.format(f=fast))
+        print('naive      {n:,.0f} instructions/s'.format(n=naive))
+        print('speedup    {s:.2f}x'.format(s=fast / naive))
+    else:
+        emulator = Emulator.load(path)
+        start = time.perf_counter()
+        emulator.run(cycles)
+        elapsed = time.perf_counter() - start
+        print('cycles {c}  halted {h}  {r:,.0f} instructions/s'.format(
+            c=emulator.cycles, h=emulator.halted, r=emulator.cycles / elapsed))
+        print('PC {p}  A {a}  D {d}'.format(p=emulator.pc, a=emulator.a, d=emulator.d))
+        print('RAM[0..15] ' + ' '.join(str(v) for v in emulator.ram[:16]))
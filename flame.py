@@ -0,0 +1,112 @@
+"""
+Call stacks of a Hack program translated from VM code, written in the collapsed format that
+flame graph tools read (one "outer;inner cycles" line per stack).
+
+A jump to a Class.sub label is a call when it starts a new frame: the VM call sequence has just
+set LCL, saved the return address at RAM[LCL-5] and the caller's LCL at RAM[LCL-4]. A jump to
+the return address of the innermost frame, with the caller's LCL back in place, is its return.
+The shared routines of the translator (vm.call, vm.return, the comparisons) are only jumped
+through, so the bootstrap's call reaches Sys.init through vm.call and Sys.init is the outermost
+frame.
+
+python flame.py filename.asm [cycles] [-o out.folded]
+"""
+import sys
+
+import emulator
+import profiler
+import virtualMachine
+
+LCL = 1
+
+# labels that look like functions but never start a frame
+ROUTINES = ({virtualMachine.CALL_LABEL, virtualMachine.RETURN_LABEL, virtualMachine.HALT_LABEL} |
+            {'vm.' + command for command in virtualMachine.COMPARISON_JUMPS})
+
+
+class CallTracker:
+    """
+    Follows calls and returns through the jump hook of the emulator and charges the cycles spent
+    to the stack that was active
+    """
+
+    def __init__(self, machine, labels):
+        """
+        :param machine: Emulator running the program
+        :param labels: label name -> ROM address from the assembler
+        """
+        self.machine = machine
+        self.functions = {}
+        for label, address in labels.items():
+            if profiler.is_function(label) and label not in ROUTINES:
+                self.functions[address] = label
+        self.targets = set(self.functions)
+        # (function, LCL of its frame, return address, LCL of the caller)
+        self.frames = []
+        self.stack = (profiler.NO_LABEL,)
+        self.samples = {}
+        self.start = machine.cycles
+        self.mark = machine.cycles
+
+    def charge(self, now):
+        # cycles since the last change go to the current stack
+        if now > self.mark:
+            self.samples[self.stack] = self.samples.get(self.stack, 0) + now - self.mark
+            self.mark = now
+
+    def hook(self, pc, executed):
+        ram = self.machine.ram
+        lcl = ram[LCL]
+        frames = self.frames
+        if frames and pc == frames[-1][2] and lcl == frames[-1][3]:
+            self.charge(self.start + executed)
+            frames.pop()
+            self.stack = self.stack[:-1]
+            return
+        name = self.functions.get(pc)
+        if name is None:
+            return
+        if frames and frames[-1][1] == lcl:
+            # a loop back to the first instruction of the running function
+            return
+        self.charge(self.start + executed)
+        ret = ram[(lcl - 5) & 32767] & 32767
+        frames.append((name, lcl, ret, ram[(lcl - 4) & 32767]))
+        self.targets.add(ret)
+        self.stack = self.stack + (name,)
+
+    def run(self, cycles):
+        """
+        Runs the program with call tracking
+        :param cycles: maximum number of instructions
+        :return: number of instructions executed
+        """
+        self.start = self.machine.cycles
+        n = self.machine.run_hooked(cycles, self.targets, self.hook)
+        self.charge(self.machine.cycles)
+        return n
+
+    def collapsed(self):
+        """
+        :return: lines of "frame;frame;frame cycles", largest first
+        """
+        ordered = sorted(self.samples.items(), key=lambda item: -item[1])
+        return ['{s} {c}'.format(s=';'.join(stack), c=count) for stack, count in ordered]
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    output = None
+    if '-o' in args:
+        i = args.index('-o')
+        output = args[i + 1]
+        del args[i:i + 2]
+    words, labels, _ = profiler.load_program(args[0])
+    tracker = CallTracker(emulator.Emulator(words), labels)
+    tracker.run(int(args[1]) if len(args) > 1 else 10 ** 7)
+    lines = tracker.collapsed()
+    if output is None:
+        print('\n'.join(lines))
+    else:
+        with open(output, 'w') as out:
+            out.write('\n'.join(lines) + '\n')
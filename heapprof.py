@@ -0,0 +1,171 @@
+"""
+Heap allocations of a Hack program translated from Jack. Entries to Memory.alloc and
+Memory.deAlloc are caught through the jump hook of the emulator, the size and the object are read
+through ARG, and the block alloc returns is read off the stack when it jumps back to its caller.
+
+Call sites are the first caller outside the OS classes, found by walking the saved LCL chain, so
+a String.new for a literal is charged to the function holding the literal.
+
+python heapprof.py filename.asm [cycles] [-top N]
+"""
+import sys
+
+import emulator
+import profiler
+
+SP = 0
+LCL = 1
+ARG = 2
+
+OS_CLASSES = ('Array', 'Keyboard', 'Math', 'Memory', 'Output', 'Screen', 'String', 'Sys')
+
+# frames walked up from alloc before giving up on finding user code
+MAX_DEPTH = 32
+
+
+class HeapProfiler:
+    """
+    Follows alloc and deAlloc while the emulator runs
+    """
+
+    def __init__(self, machine, labels):
+        """
+        :param machine: Emulator running the program
+        :param labels: label name -> ROM address from the assembler
+        """
+        if 'Memory.alloc' not in labels:
+            raise Exception("Program has no Memory.alloc function")
+        self.machine = machine
+        self.alloc = labels['Memory.alloc']
+        self.dealloc = labels.get('Memory.deAlloc')
+        self.owner = profiler.owners(labels, machine.size, profiler.is_function)
+        self.targets = {self.alloc}
+        if self.dealloc is not None:
+            self.targets.add(self.dealloc)
+        # (return address, caller LCL, LCL of the alloc frame, size, call site) of running allocs
+        self.pending = []
+        # block address -> (size, call site)
+        self.live = {}
+        # call site -> [allocations, words]
+        self.sites = {}
+        self.allocations = 0
+        self.frees = 0
+        self.words = 0
+        self.live_words = 0
+        self.peak = 0
+        self.unknown_frees = 0
+
+    def site(self, lcl):
+        """
+        Call site of the frame with the given LCL, skipping frames that belong to the OS
+        :param lcl: LCL of the alloc frame
+        :return: "function@return address"
+        """
+        ram = self.machine.ram
+        size = self.machine.size
+        site = profiler.NO_LABEL
+        for _ in range(MAX_DEPTH):
+            if lcl < 5:
+                break
+            ret = ram[lcl - 5] & 32767
+            if ret >= size:
+                break
+            function = self.owner[ret]
+            site = '{f}@{r}'.format(f=function, r=ret)
+            if function.split('.')[0] not in OS_CLASSES:
+                break
+            lcl = ram[lcl - 4]
+        return site
+
+    def hook(self, pc, executed):
+        ram = self.machine.ram
+        lcl = ram[LCL]
+        pending = self.pending
+        if pending and pc == pending[-1][0] and lcl == pending[-1][1]:
+            _, _, _, words, site = pending.pop()
+            block = ram[(ram[SP] - 1) & 32767]
+            self.allocated(block, words, site)
+            return
+        if pending and pending[-1][2] == lcl:
+            # a loop back to the first instruction of alloc
+            return
+        if pc == self.alloc:
+            ret = ram[(lcl - 5) & 32767] & 32767
+            pending.append((ret, ram[(lcl - 4) & 32767], lcl, ram[ram[ARG] & 32767], self.site(lcl)))
+            self.targets.add(ret)
+        elif pc == self.dealloc:
+            self.freed(ram[ram[ARG] & 32767])
+
+    def allocated(self, block, words, site):
+        self.allocations += 1
+        self.words += words
+        entry = self.sites.setdefault(site, [0, 0])
+        entry[0] += 1
+        entry[1] += words
+        old = self.live.pop(block, None)
+        if old is not None:
+            self.live_words -= old[0]
+        self.live[block] = (words, site)
+        self.live_words += words
+        self.peak = max(self.peak, self.live_words)
+
+    def freed(self, block):
+        self.frees += 1
+        entry = self.live.pop(block, None)
+        if entry is None:
+            self.unknown_frees += 1
+        else:
+            self.live_words -= entry[0]
+
+    def run(self, cycles):
+        """
+        Runs the program with the allocation hooks
+        :param cycles: maximum number of instructions
+        :return: number of instructions executed
+        """
+        return self.machine.run_hooked(cycles, self.targets, self.hook)
+
+    def fragmentation(self):
+        """
+        Share of the heap span between the lowest and highest live block that is not live
+        :return: 0.0 to 1.0
+        """
+        if not self.live:
+            return 0.0
+        low = min(self.live)
+        high = max(block + words for block, (words, _) in self.live.items())
+        return 1.0 - self.live_words / max(high - low, 1)
+
+    def report(self, top=10):
+        """
+        :param top: number of call sites listed
+        :return: text report
+        """
+        cycles = max(self.machine.cycles, 1)
+        lines = ['cycles              {c}'.format(c=self.machine.cycles),
+                 'allocations         {a}  ({r:.1f} per million cycles)'.format(
+                     a=self.allocations, r=1e6 * self.allocations / cycles),
+                 'words allocated     {w}  ({r:.1f} per million cycles)'.format(w=self.words, r=1e6 * self.words / cycles),
+                 'frees               {f}  ({u} of unknown blocks)'.format(f=self.frees, u=self.unknown_frees),
+                 'live                {w} words in {b} blocks, peak {p}'.format(
+                     w=self.live_words, b=len(self.live), p=self.peak),
+                 'fragmentation       {f:.1f}%'.format(f=100.0 * self.fragmentation()),
+                 '',
+                 '{s:<40}{c:>10}{w:>10}'.format(s='call site', c='allocs', w='words')]
+        ordered = sorted(self.sites.items(), key=lambda item: -item[1][1])
+        for site, (count, words) in ordered[:top]:
+            lines.append('{s:<40}{c:>10}{w:>10}'.format(s=site, c=count, w=words))
+        return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    top = 10
+    if '-top' in args:
+        i = args.index('-top')
+        top = int(args[i + 1])
+        del args[i:i + 2]
+    words, labels, _ = profiler.load_program(args[0])
+    heap = HeapProfiler(emulator.Emulator(words), labels)
+    heap.run(int(args[1]) if len(args) > 1 else 10 ** 7)
+    print(heap.report(top))
@@ -0,0 +1,152 @@
+"""
+RAM read and write counts of a Hack program, summed by segment. Statics are named after the
+variables the assembler allocated, the heap is shown in buckets of HEAP_BUCKET words.
+
+python heatmap.py filename.asm [cycles] [-sample N] [-top N]
+counts every access, or one instruction in N with -sample
+"""
+import sys
+
+import emulator
+import profiler
+
+HEAP_BUCKET = 64
+
+# name, first address, last address
+SEGMENTS = [('pointers', 0, 4), ('temp', 5, 12), ('R13-R15', 13, 15), ('statics', 16, 255),
+            ('stack', 256, 2047), ('heap', 2048, 16383), ('screen', 16384, 24575), ('keyboard', 24576, 24576),
+            ('unmapped', 24577, 32767)]
+
+
+class HeatMap:
+    """
+    Per address access counts, filled by running an emulator exactly or sampled
+    """
+
+    def __init__(self, machine, variables=None):
+        """
+        :param machine: Emulator to run
+        :param variables: name -> RAM address from the assembler, used to name statics
+        """
+        self.machine = machine
+        self.names = {address: name for name, address in (variables or {}).items()}
+        self.reads = [0] * emulator.RAM_SIZE
+        self.writes = [0] * emulator.RAM_SIZE
+        self.scale = 1
+
+    def run(self, cycles):
+        """
+        Counts every RAM access until the program halts
+        :param cycles: maximum number of instructions
+        :return: number of instructions executed
+        """
+        machine = self.machine
+        code = machine.code
+        reads, writes = self.reads, self.writes
+
+        def count(pc, a, next_pc):
+            ins = code[pc]
+            if ins.__class__ is not int:
+                if ins[1]:
+                    reads[a] += 1
+                if ins[2] & emulator.DEST_M:
+                    writes[a] += 1
+
+        return machine.execute(cycles, machine.halting, count)
+
+    def sample(self, cycles, period):
+        """
+        Runs at full speed and looks at one instruction in every period, counts are scaled up
+        :param cycles: maximum number of instructions
+        :param period: instructions per sample
+        :return: number of instructions executed
+        """
+        machine = self.machine
+        self.scale = period
+        n = 0
+        while n < cycles and not machine.halted:
+            n += machine.run(min(period - 1, cycles - n))
+            if n == cycles or machine.halted or machine.pc >= machine.size:
+                break
+            ins = machine.code[machine.pc]
+            if ins.__class__ is not int:
+                if ins[1]:
+                    self.reads[machine.a] += 1
+                if ins[2] & emulator.DEST_M:
+                    self.writes[machine.a] += 1
+            n += machine.run(1)
+        return n
+
+    def segments(self):
+        """
+        :return: {segment: (reads, writes, addresses touched)} in SEGMENTS order
+        """
+        totals = {}
+        for name, first, last in SEGMENTS:
+            reads = sum(self.reads[first:last + 1]) * self.scale
+            writes = sum(self.writes[first:last + 1]) * self.scale
+            touched = sum(1 for address in range(first, last + 1) if self.reads[address] or self.writes[address])
+            totals[name] = (reads, writes, touched)
+        return totals
+
+    def statics(self):
+        """
+        :return: [(name, reads, writes)] of the accessed statics, hottest first
+        """
+        rows = []
+        for address in range(16, 256):
+            if self.reads[address] or self.writes[address]:
+                name = self.names.get(address, str(address))
+                rows.append((name, self.reads[address] * self.scale, self.writes[address] * self.scale))
+        return sorted(rows, key=lambda row: -(row[1] + row[2]))
+
+    def heap(self):
+        """
+        :return: [(first address, reads, writes)] of the accessed heap buckets, hottest first
+        """
+        rows = []
+        for first in range(2048, 16384, HEAP_BUCKET):
+            reads = sum(self.reads[first:first + HEAP_BUCKET]) * self.scale
+            writes = sum(self.writes[first:first + HEAP_BUCKET]) * self.scale
+            if reads or writes:
+                rows.append((first, reads, writes))
+        return sorted(rows, key=lambda row: -(row[1] + row[2]))
+
+    def report(self, top=10):
+        """
+        :param top: rows in the statics and heap tables
+        :return: text report
+        """
+        segments = self.segments()
+        total = sum(reads + writes for reads, writes, _ in segments.values()) or 1
+        lines = ['{s:<12}{r:>12}{w:>12}{p:>8}{t:>10}'.format(s='segment', r='reads', w='writes', p='%', t='touched')]
+        for name, (reads, writes, touched) in segments.items():
+            if reads or writes:
+                lines.append('{s:<12}{r:>12}{w:>12}{p:>7.2f}%{t:>10}'.format(
+                    s=name, r=reads, w=writes, p=100.0 * (reads + writes) / total, t=touched))
+        lines += ['', '{s:<28}{r:>12}{w:>12}'.format(s='static', r='reads', w='writes')]
+        for name, reads, writes in self.statics()[:top]:
+            lines.append('{s:<28}{r:>12}{w:>12}'.format(s=name, r=reads, w=writes))
+        lines += ['', '{s:<28}{r:>12}{w:>12}'.format(s='heap words', r='reads', w='writes')]
+        for first, reads, writes in self.heap()[:top]:
+            span = '{f}-{l}'.format(f=first, l=first + HEAP_BUCKET - 1)
+            lines.append('{s:<28}{r:>12}{w:>12}'.format(s=span, r=reads, w=writes))
+        return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    options = {}
+    for option in ('-sample', '-top'):
+        if option in args:
+            i = args.index(option)
+            options[option] = int(args[i + 1])
+            del args[i:i + 2]
+    words, _, variables = profiler.load_program(args[0])
+    heat = HeatMap(emulator.Emulator(words), variables)
+    cycles = int(args[1]) if len(args) > 1 else 10 ** 7
+    if '-sample' in options:
+        heat.sample(cycles, options['-sample'])
+    else:
+        heat.run(cycles)
+    print(heat.report(options.get('-top', 10)))
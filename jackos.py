@@ -0,0 +1,431 @@
+"""
+The Jack OS classes Math, Memory, Array, String, Output and Screen written in Python, for the VM
+interpreter to call instead of the compiled OS. Results and the words written to the heap and the
+screen follow the reference algorithms of the course:
+
+- Math: 16 bit results, divide truncates towards zero, sqrt is the floor
+- Memory: the heap runs from 2048 to 16383 and starts as one free block. A free block holds its size,
+  header included, and the next free block. alloc takes the first block that fits, cuts the object
+  from its end and leaves the size in the word before the object. deAlloc pushes the block on the
+  free list without merging it.
+- String: an object of three words, maximum length, length and a character Array (none when
+  the maximum length is 0)
+- Screen: pixels are the ones the reference line, rectangle and circle algorithms draw, lines go
+  from the left end point
+- Output: characters are 8 by 11 pixels on a 64 by 23 grid. The glyphs are the ones the program's
+  Output.initMap passes to Output.create, so Output.init runs as VM code when the program has it.
+  Without it every character is blank.
+
+The free list head, the color and the cursor are kept in Python instead of OS statics. Keyboard and
+Sys.init stay VM code, Sys.halt stops the interpreter and Sys.wait returns at once.
+
+python jackos.py file.vm|directory [steps] [-pbm out.pbm]
+"""
+import math
+import sys
+import time
+from array import array
+
+import emulator
+import screen
+import vminterp
+
+HEAP_BASE = 2048
+HEAP_END = 16384
+SCREEN = 16384
+KBD = 24576
+WIDTH = 512
+HEIGHT = 256
+ROWS = 23
+COLUMNS = 64
+GLYPH_ROWS = 11
+NEW_LINE = 128
+BACKSPACE = 129
+DOUBLE_QUOTE = 34
+
+
+def signed(word):
+    return word - 65536 if word >= 32768 else word
+
+
+def error(code, text):
+    raise Exception("Sys.error {c}: {t}".format(c=code, t=text))
+
+
+class JackOS:
+    """
+    OS state and natives for one VMInterpreter RAM
+    """
+
+    def __init__(self, ram):
+        """
+        :param ram: RAM the program runs on
+        """
+        self.ram = ram
+        self.glyphs = {}
+        self.free = HEAP_BASE
+        self.color = True
+        self.row = 0
+        self.column = 0
+        self.memory_init()
+
+    def natives(self, program):
+        """
+        :param program: VMProgram, Output.init and Output.initMap stay VM code when it has them
+        :return: function name -> native, for VMInterpreter
+        """
+        natives = {
+            'Math.init': self.math_init, 'Math.abs': self.abs, 'Math.multiply': self.multiply,
+            'Math.divide': self.divide, 'Math.min': self.min, 'Math.max': self.max, 'Math.sqrt': self.sqrt,
+            'Memory.init': self.memory_init, 'Memory.peek': self.peek, 'Memory.poke': self.poke,
+            'Memory.alloc': self.alloc, 'Memory.deAlloc': self.dealloc,
+            'Array.new': self.array_new, 'Array.dispose': self.dealloc,
+            'String.new': self.string_new, 'String.dispose': self.string_dispose,
+            'String.length': self.length, 'String.charAt': self.char_at, 'String.setCharAt': self.set_char_at,
+            'String.appendChar': self.append_char, 'String.eraseLastChar': self.erase_last_char,
+            'String.intValue': self.int_value, 'String.setInt': self.set_int,
+            'String.backSpace': lambda: BACKSPACE, 'String.doubleQuote': lambda: DOUBLE_QUOTE,
+            'String.newLine': lambda: NEW_LINE,
+            'Output.init': self.output_init, 'Output.create': self.create, 'Output.moveCursor': self.move_cursor,
+            'Output.printChar': self.print_char, 'Output.printString': self.print_string,
+            'Output.printInt': self.print_int, 'Output.println': self.println, 'Output.backSpace': self.backspace,
+            'Screen.init': self.screen_init, 'Screen.clearScreen': self.clear_screen,
+            'Screen.setColor': self.set_color, 'Screen.drawPixel': self.draw_pixel,
+            'Screen.drawLine': self.draw_line, 'Screen.drawRectangle': self.draw_rectangle,
+            'Screen.drawCircle': self.draw_circle,
+            'Sys.halt': self.halt, 'Sys.error': self.sys_error, 'Sys.wait': lambda duration: 0,
+        }
+        if 'Output.initMap' in program.functions:
+            # the VM Output.init builds the font through Output.create
+            del natives['Output.init']
+        return natives
+
+    # Math
+
+    def math_init(self):
+        return 0
+
+    def abs(self, x):
+        return -x if x < 0 else x
+
+    def multiply(self, x, y):
+        return x * y
+
+    def divide(self, x, y):
+        if y == 0:
+            error(3, "Division by zero")
+        q = abs(x) // abs(y)
+        return -q if (x < 0) != (y < 0) else q
+
+    def min(self, x, y):
+        return x if x < y else y
+
+    def max(self, x, y):
+        return x if x > y else y
+
+    def sqrt(self, x):
+        if x < 0:
+            error(4, "Cannot compute square root of a negative number")
+        return math.isqrt(x)
+
+    # Memory
+
+    def memory_init(self):
+        self.free = HEAP_BASE
+        self.ram[HEAP_BASE] = HEAP_END - HEAP_BASE
+        self.ram[HEAP_BASE + 1] = 0
+        return 0
+
+    def peek(self, address):
+        return self.ram[address]
+
+    def poke(self, address, value):
+        self.ram[address] = value
+        return 0
+
+    def alloc(self, size):
+        if size <= 0:
+            error(5, "Allocated memory size must be positive")
+        ram = self.ram
+        need = size + 1
+        previous = 0
+        block = self.free
+        while block:
+            length = ram[block]
+            if length >= need + 2:
+                # cut the object from the end, the rest stays a free block
+                ram[block] = length - need
+                header = block + length - need
+                ram[header] = need
+                return header + 1
+            if length >= need:
+                if previous:
+                    ram[previous + 1] = ram[block + 1]
+                else:
+                    self.free = ram[block + 1]
+                return block + 1
+            previous = block
+            block = ram[block + 1]
+        error(6, "Heap overflow")
+
+    def dealloc(self, address):
+        block = address - 1
+        self.ram[block + 1] = self.free
+        self.free = block
+        return 0
+
+    def array_new(self, size):
+        if size <= 0:
+            error(2, "Array size must be positive")
+        return self.alloc(size)
+
+    # String
+
+    def string_new(self, maximum):
+        if maximum < 0:
+            error(14, "Maximum length must be non-negative")
+        ram = self.ram
+        this = self.alloc(3)
+        ram[this] = maximum
+        ram[this + 1] = 0
+        ram[this + 2] = self.alloc(maximum) if maximum else 0
+        return this
+
+    def string_dispose(self, this):
+        if self.ram[this + 2]:
+            self.dealloc(self.ram[this + 2])
+        return self.dealloc(this)
+
+    def length(self, this):
+        return self.ram[this + 1]
+
+    def char_at(self, this, j):
+        if j < 0 or j >= self.ram[this + 1]:
+            error(15, "String index out of bounds")
+        return self.ram[self.ram[this + 2] + j]
+
+    def set_char_at(self, this, j, c):
+        if j < 0 or j >= self.ram[this + 1]:
+            error(16, "String index out of bounds")
+        self.ram[self.ram[this + 2] + j] = c
+        return 0
+
+    def append_char(self, this, c):
+        ram = self.ram
+        length = ram[this + 1]
+        if length >= ram[this]:
+            error(17, "String is full")
+        ram[ram[this + 2] + length] = c
+        ram[this + 1] = length + 1
+        return this
+
+    def erase_last_char(self, this):
+        if self.ram[this + 1] <= 0:
+            error(18, "String is empty")
+        self.ram[this + 1] -= 1
+        return 0
+
+    def chars(self, this):
+        ram = self.ram
+        buffer = ram[this + 2]
+        return ram[buffer:buffer + ram[this + 1]]
+
+    def int_value(self, this):
+        value = 0
+        chars = self.chars(this)
+        negative = len(chars) > 0 and chars[0] == ord('-')
+        for c in chars[1 if negative else 0:]:
+            if c < ord('0') or c > ord('9'):
+                break
+            value = value * 10 + c - ord('0')
+        return -value if negative else value
+
+    def set_int(self, this, value):
+        text = str(value)
+        if len(text) > self.ram[this]:
+            error(19, "Insufficient string capacity")
+        buffer = self.ram[this + 2]
+        for i, c in enumerate(text):
+            self.ram[buffer + i] = ord(c)
+        self.ram[this + 1] = len(text)
+        return 0
+
+    # Output
+
+    def output_init(self):
+        self.row = 0
+        self.column = 0
+        return 0
+
+    def create(self, index, *rows):
+        self.glyphs[index] = rows
+        return 0
+
+    def draw_char(self, c):
+        # characters outside the printable range show glyph 0, the reference black box
+        glyph = self.glyphs.get(c if 32 <= c <= 126 else 0)
+        ram = self.ram
+        address = SCREEN + self.row * GLYPH_ROWS * 32 + self.column // 2
+        odd = self.column & 1
+        for i in range(GLYPH_ROWS):
+            bits = glyph[i] & 255 if glyph else 0
+            word = ram[address] & 65535
+            word = (word & 255) | (bits << 8) if odd else (word & 0xFF00) | bits
+            ram[address] = signed(word)
+            address += 32
+
+    def move_cursor(self, i, j):
+        if i < 0 or i >= ROWS or j < 0 or j >= COLUMNS:
+            error(20, "Illegal cursor location")
+        self.row = i
+        self.column = j
+        self.draw_char(32)
+        return 0
+
+    def print_char(self, c):
+        if c == NEW_LINE:
+            return self.println()
+        if c == BACKSPACE:
+            return self.backspace()
+        self.draw_char(c)
+        if self.column == COLUMNS - 1:
+            self.println()
+        else:
+            self.column += 1
+        return 0
+
+    def print_string(self, this):
+        for c in self.chars(this):
+            self.print_char(c)
+        return 0
+
+    def print_int(self, value):
+        for c in str(value):
+            self.print_char(ord(c))
+        return 0
+
+    def println(self):
+        self.column = 0
+        self.row = self.row + 1 if self.row < ROWS - 1 else 0
+        return 0
+
+    def backspace(self):
+        if self.column:
+            self.column -= 1
+        elif self.row:
+            self.row -= 1
+            self.column = COLUMNS - 1
+        return 0
+
+    # Screen
+
+    def screen_init(self):
+        self.color = True
+        return 0
+
+    def clear_screen(self):
+        for address in range(SCREEN, KBD):
+            self.ram[address] = 0
+        return 0
+
+    def set_color(self, color):
+        self.color = color != 0
+        return 0
+
+    def span(self, y, x1, x2):
+        # pixels x1..x2 of row y, a word at a time
+        ram = self.ram
+        row = SCREEN + y * 32
+        for word in range(x1 >> 4, (x2 >> 4) + 1):
+            low = max(x1, word << 4) & 15
+            high = min(x2, (word << 4) + 15) & 15
+            mask = (2 << high) - (1 << low)
+            if self.color:
+                ram[row + word] = signed((ram[row + word] & 65535) | mask)
+            else:
+                ram[row + word] = signed(ram[row + word] & 65535 & ~mask)
+
+    def draw_pixel(self, x, y):
+        if x < 0 or x >= WIDTH or y < 0 or y >= HEIGHT:
+            error(7, "Illegal pixel coordinates")
+        self.span(y, x, x)
+        return 0
+
+    def draw_line(self, x1, y1, x2, y2):
+        if min(x1, x2) < 0 or max(x1, x2) >= WIDTH or min(y1, y2) < 0 or max(y1, y2) >= HEIGHT:
+            error(8, "Illegal line coordinates")
+        if x1 > x2:
+            x1, y1, x2, y2 = x2, y2, x1, y1
+        dx = x2 - x1
+        dy = y2 - y1
+        if dy == 0:
+            self.span(y1, x1, x2)
+            return 0
+        step = 1 if dy > 0 else -1
+        dy = abs(dy)
+        if dx == 0:
+            for b in range(dy + 1):
+                self.span(y1 + b * step, x1, x1)
+            return 0
+        a = b = diff = 0
+        while a <= dx and b <= dy:
+            self.span(y1 + b * step, x1 + a, x1 + a)
+            if diff < 0:
+                a += 1
+                diff += dy
+            else:
+                b += 1
+                diff -= dx
+        return 0
+
+    def draw_rectangle(self, x1, y1, x2, y2):
+        if x1 > x2 or y1 > y2 or x1 < 0 or x2 >= WIDTH or y1 < 0 or y2 >= HEIGHT:
+            error(9, "Illegal rectangle coordinates")
+        for y in range(y1, y2 + 1):
+            self.span(y, x1, x2)
+        return 0
+
+    def draw_circle(self, x, y, r):
+        if x < 0 or x >= WIDTH or y < 0 or y >= HEIGHT:
+            error(12, "Illegal center coordinates")
+        if r < 0 or r > 181 or x - r < 0 or x + r >= WIDTH or y - r < 0 or y + r >= HEIGHT:
+            error(13, "Illegal radius")
+        for dy in range(-r, r + 1):
+            h = math.isqrt(r * r - dy * dy)
+            self.span(y + dy, x - h, x + h)
+        return 0
+
+    # Sys
+
+    def halt(self):
+        raise vminterp.Halt()
+
+    def sys_error(self, code):
+        error(code, "raised by the program")
+
+
+def interpreter(path):
+    """
+    :param path: .vm file or directory
+    :return: VMInterpreter running the program with the native OS
+    """
+    program = vminterp.VMProgram(vminterp.read_vm(path))
+    ram = array('h', bytes(2 * emulator.RAM_SIZE))
+    return vminterp.VMInterpreter(program, JackOS(ram).natives(program), ram)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    out = None
+    if '-pbm' in args:
+        i = args.index('-pbm')
+        out = args[i + 1]
+        del args[i:i + 2]
+    machine = interpreter(args[0])
+    start = time.perf_counter()
+    machine.run(int(args[1]) if len(args) > 1 else 10 ** 7)
+    elapsed = time.perf_counter() - start
+    print('steps {s}  halted {h}  {t:.3f}s'.format(s=machine.steps, h=machine.halted, t=elapsed))
+    if out:
+        with open(out, 'wb') as f:
+            f.write(screen.Screen(machine.ram).pbm())
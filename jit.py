@@ -0,0 +1,364 @@
+"""
+Basic block compiler for Hack programs. Straight line runs of the ROM are turned into Python
+functions that keep A and D in locals, fold constant addresses and hold RAM words in locals
+until the block ends. Compiled blocks are cached on disk, keyed by the ROM contents.
+
+python jit.py filename.hack [cycles]
+runs the program, -bench compares against the predecoded interpreter
+"""
+import hashlib
+import importlib.util
+import marshal
+import os
+import sys
+import time
+from array import array
+
+import emulator
+import rom
+
+# bump when the generated code changes so old caches are not picked up
+JIT_VERSION = 2
+
+# longest run of instructions in one block
+MAX_BLOCK = 256
+
+CACHE_DIR = "__jitcache__"
+
+# comp expressions by ALU control bits, x is D and y is A or M
+EXPRESSIONS = {'0': '0', '1': '1', '-1': '-1', 'D': '{x}', 'A': '{y}', '!D': '~{x}', '!A': '~{y}',
+               '-D': '(32768 - {x} & 65535) - 32768', '-A': '(32768 - {y} & 65535) - 32768',
+               'D+1': '({x} + 32769 & 65535) - 32768', 'A+1': '({y} + 32769 & 65535) - 32768',
+               'D-1': '({x} + 32767 & 65535) - 32768', 'A-1': '({y} + 32767 & 65535) - 32768',
+               'D+A': '({x} + {y} + 32768 & 65535) - 32768', 'D-A': '({x} - {y} + 32768 & 65535) - 32768',
+               'A-D': '({y} - {x} + 32768 & 65535) - 32768', 'D&A': '{x} & {y}', 'D|A': '{x} | {y}'}
+
+CONDITIONS = {1: '{v} > 0', 2: '{v} == 0', 3: '{v} >= 0', 4: '{v} < 0', 5: '{v} != 0', 6: '{v} <= 0'}
+
+
+def _expression_table():
+    table = {}
+    for comp, bits in emulator.assembler.comp_0.items():
+        if comp in EXPRESSIONS:
+            table[int(bits, 2)] = EXPRESSIONS[comp]
+    return table
+
+
+EXPRESSION_TABLE = _expression_table()
+
+# comps that are just x when y is 0, or just y when x is 0
+KEEP_X = set(int(emulator.assembler.comp_0[comp], 2) for comp in ('D+A', 'D-A', 'D|A'))
+KEEP_Y = set(int(emulator.assembler.comp_0[comp], 2) for comp in ('D+A', 'D|A'))
+
+
+def rom_key(words):
+    """
+    Cache key of a ROM, also covers the Python version since code objects are marshalled
+    :param words: sequence of unsigned 16 bit instructions
+    :return: hex digest
+    """
+    digest = hashlib.sha1(array('H', words).tobytes())
+    digest.update(importlib.util.MAGIC_NUMBER)
+    digest.update(str(JIT_VERSION).encode())
+    return digest.hexdigest()
+
+
+class BlockCompiler:
+    """
+    Generates the Python source of one block. Registers are tracked as constants where possible,
+    otherwise they live in the locals a and d. RAM words at constant addresses live in locals m<k>
+    and are written back at the end of the block, or before a read through an unknown A. A write
+    through an unknown A reads back the cached word it may have hit
+    """
+
+    def __init__(self, words, start, stops=()):
+        self.words = words
+        self.start = start
+        # addresses the emulator handles itself, blocks end in front of them
+        self.stops = stops
+        self.lines = []
+        self.a = None
+        self.d = None
+        self.cached = {}
+
+    def emit(self, line):
+        self.lines.append('    ' + line)
+
+    def reg(self, value, name):
+        return name if value is None else str(value)
+
+    def flush(self):
+        # dirty RAM locals go back to RAM
+        for k, dirty in sorted(self.cached.items()):
+            if dirty:
+                self.emit('ram[{k}] = m{k}'.format(k=k))
+                self.cached[k] = False
+
+    def memory(self):
+        # the operand for M
+        if self.a is None:
+            self.flush()
+            return 'ram[a]'
+        k = self.a & 32767
+        if k not in self.cached:
+            self.emit('m{k} = ram[{k}]'.format(k=k))
+            self.cached[k] = False
+        return 'm{k}'.format(k=k)
+
+    def exit(self, target, n, indent=''):
+        # leaves the block without changing what the compiler knows, the fall through path goes on
+        for k, dirty in sorted(self.cached.items()):
+            if dirty:
+                self.emit(indent + 'ram[{k}] = m{k}'.format(k=k))
+        self.emit(indent + 'return {t}, {a}, {d}, {n}'.format(
+            t=target, a=self.reg(self.a, 'a'), d=self.reg(self.d, 'd'), n=n))
+
+    def compile(self):
+        """
+        Follows the ROM from the start address through constant jumps, conditional jumps leave
+        the block when taken
+        :return: (source of a function named block, largest number of instructions it runs)
+        """
+        pc = self.start
+        size = len(self.words)
+        visited = set()
+        n = 0
+        while pc is not None:
+            if pc >= size or pc in visited or n == MAX_BLOCK or (n and pc in self.stops):
+                self.exit(pc, n)
+                break
+            visited.add(pc)
+            word = self.words[pc]
+            n += 1
+            if not word & 0x8000:
+                self.a = word
+                pc += 1
+            else:
+                pc = self.instruction(word, pc + 1, n)
+        return 'def block(a, d, ram):\n' + '\n'.join(self.lines) + '\n', n
+
+    def instruction(self, word, pc, n):
+        """
+        Emits one C-instruction
+        :param word: the instruction
+        :param pc: address of the next instruction
+        :param n: instructions in the block so far, this one included
+        :return: address compiled next, None when the block ends here
+        """
+        control = (word >> 6) & 63
+        dest = (word >> 3) & 7
+        jump = word & 7
+        x = self.d
+        if word & 0x1000:
+            y = None
+            y_text = self.memory()
+        else:
+            y = self.a
+            y_text = self.reg(self.a, 'a')
+        value = None
+        text = None
+        if x is not None and y is not None:
+            value = emulator.ALU_TABLE[control](x, y)
+        elif y == 0 and control in KEEP_X:
+            text = self.reg(x, 'd')
+        elif x == 0 and control in KEEP_Y:
+            text = y_text
+        elif control in EXPRESSION_TABLE:
+            text = EXPRESSION_TABLE[control].format(x=self.reg(x, 'd'), y=y_text)
+        else:
+            text = 'alu({c}, {x}, {y})'.format(c=control, x=self.reg(x, 'd'), y=y_text)
+        if text is not None and text.lstrip('-').isdigit():
+            value, text = int(text), None
+        target = self.a
+        if jump and target is None and dest & emulator.DEST_A:
+            self.emit('t = a')
+        if text is not None and not jump and bin(dest).count('1') > 1 and \
+                (self.a is not None or not dest & emulator.DEST_M):
+            # one chained assignment, M at a constant address is a local too
+            names = []
+            if dest & emulator.DEST_M:
+                k = self.a & 32767
+                names.append('m{k}'.format(k=k))
+                self.cached[k] = True
+            if dest & emulator.DEST_D:
+                names.append('d')
+                self.d = None
+            if dest & emulator.DEST_A:
+                names.append('a')
+                self.a = None
+            self.emit(' = '.join(names) + ' = ' + text)
+            return pc
+        if text is not None and not text.isidentifier() and (jump or bin(dest).count('1') > 1):
+            self.emit('v = ' + text)
+            text = 'v'
+        if dest & emulator.DEST_M:
+            self.write_memory(value, text)
+        if dest & emulator.DEST_D:
+            self.d = value
+            if text is not None:
+                self.emit('d = ' + text)
+        if dest & emulator.DEST_A:
+            if text is not None:
+                self.emit('a = ' + text)
+            self.a = value
+        if not jump:
+            return pc
+        if target is not None:
+            destination = target & 32767
+        elif dest & emulator.DEST_A:
+            destination = 't & 32767'
+        else:
+            destination = 'a & 32767'
+        if value is not None:
+            taken = (jump & emulator.JUMP_LT and value < 0) or (jump & emulator.JUMP_EQ and value == 0) or \
+                (jump & emulator.JUMP_GT and value > 0)
+        elif jump == 7:
+            taken = True
+        else:
+            self.emit('if ' + CONDITIONS[jump].format(v=text) + ':')
+            self.exit(destination, n, '    ')
+            return pc
+        if not taken:
+            return pc
+        if target is not None:
+            return destination
+        self.exit(destination, n)
+        return None
+
+    def write_memory(self, value, text):
+        rhs = text if text is not None else str(value)
+        if self.a is None:
+            # any cached word could be the one written, it is read back when it is,
+            # negative addresses wrap around to the top of RAM like the interpreter's
+            self.emit('ram[a] = ' + rhs)
+            if self.cached:
+                self.emit('if a <= {h}:'.format(h=max(self.cached)))
+                for k in sorted(self.cached):
+                    self.emit('    if a & 32767 == {k}: m{k} = ram[{k}]'.format(k=k))
+            return
+        k = self.a & 32767
+        self.emit('m{k} = {r}'.format(k=k, r=rhs))
+        self.cached[k] = True
+
+
+class JitEmulator(emulator.Emulator):
+    """
+    Emulator that runs compiled blocks, falling back to the interpreter for the last few
+    instructions of a cycle budget
+    """
+
+    def __init__(self, words, cache_dir=CACHE_DIR):
+        """
+        :param words: sequence of unsigned 16 bit instructions
+        :param cache_dir: directory for compiled blocks, None to keep them in memory only
+        """
+        emulator.Emulator.__init__(self, words)
+        self.stops = set(self.loops) | set(emulator.self_loops(words))
+        self.blocks = {}
+        self.codes = {}
+        self.new_codes = False
+        self.cache_file = None
+        if cache_dir is not None:
+            self.cache_file = os.path.join(cache_dir, rom_key(words) + '.marshal')
+            if os.path.isfile(self.cache_file):
+                with open(self.cache_file, 'rb') as f:
+                    self.codes = marshal.load(f)
+
+    @staticmethod
+    def load(path, cache_dir=CACHE_DIR):
+        return JitEmulator(rom.load_rom(path), cache_dir)
+
+    def block(self, pc):
+        """
+        Compiled function for the block starting at pc
+        :param pc: ROM address
+        :return: (function, number of instructions)
+        """
+        entry = self.codes.get(pc)
+        if entry is None:
+            source, length = BlockCompiler(self.rom, pc, self.stops).compile()
+            entry = self.codes[pc] = (compile(source, '<hack block {p}>'.format(p=pc), 'exec'), length)
+            self.new_codes = True
+        code, length = entry
+        namespace = {'alu': emulator.alu}
+        exec(code, namespace)
+        self.blocks[pc] = (namespace['block'], length)
+        return self.blocks[pc]
+
+    def save_cache(self):
+        """
+        Writes the compiled blocks for the next run of the same ROM
+        :return:
+        """
+        if self.cache_file is None or not self.new_codes:
+            return
+        os.makedirs(os.path.dirname(self.cache_file) or '.', exist_ok=True)
+        with open(self.cache_file, 'wb') as f:
+            marshal.dump(self.codes, f)
+        self.new_codes = False
+
+    def run(self, cycles):
+        """
+        Executes whole blocks while they fit in the budget, the interpreter does the rest and
+        the emulator handles halts and write-free loops
+        :param cycles: maximum number of instructions
+        :return: number of instructions executed
+        """
+        n = 0
+        while n < cycles and not self.halted:
+            n += self.run_blocks(cycles - n)
+            if n < cycles and not self.halted:
+                if self.fast[self.pc].__class__ in (int, tuple):
+                    n += self.interpret(cycles - n)
+                else:
+                    n += self.at_marker(cycles - n)
+        return n
+
+    def run_blocks(self, cycles):
+        """
+        Executes blocks until the next one does not fit in the budget or a marker is reached
+        :param cycles: maximum number of instructions
+        :return: number of instructions executed
+        """
+        blocks = self.blocks
+        fast = self.fast
+        ram = self.ram
+        size = self.size
+        pc, a, d = self.pc, self.a, self.d
+        n = 0
+        while pc < size:
+            entry = blocks.get(pc)
+            if entry is None:
+                if fast[pc].__class__ not in (int, tuple):
+                    break
+                entry = self.block(pc)
+            fn, length = entry
+            if n + length > cycles:
+                break
+            pc, a, d, k = fn(a, d, ram)
+            n += k
+        self.pc, self.a, self.d = pc, a, d
+        self.cycles += n
+        if pc >= size:
+            self.halted = True
+        return n
+
+
+if __name__ == '__main__':
+    path = sys.argv[1]
+    args = [arg for arg in sys.argv[2:] if not arg.startswith('-')]
+    cycles = int(args[0]) if args else 10 ** 7
+    machine = JitEmulator.load(path)
+    start = time.perf_counter()
+    machine.run(cycles)
+    elapsed = time.perf_counter() - start
+    machine.save_cache()
+    print('cycles {c}  halted {h}  {r:,.0f} instructions/s'.format(
+        c=machine.cycles, h=machine.halted, r=machine.cycles / elapsed))
+    if '-bench' in sys.argv:
+        interpreter = emulator.Emulator.load(path)
+        start = time.perf_counter()
+        interpreter.run(machine.cycles)
+        rate = interpreter.cycles / (time.perf_counter() - start)
+        print('interpreter {r:,.0f} instructions/s  speedup {s:.1f}x'.format(
+            r=rate, s=machine.cycles / elapsed / rate))
@@ -0,0 +1,791 @@
+"""
+Assembly to assembly optimisation passes, run on the output of the VM translator before it is encoded
+
+python optimizer.py filename.asm [-sp]
+writes filename.opt.asm and prints how many instructions each rule removed,
+-sp assumes the VM convention that SP never points at R0..R15, for translator output only
+"""
+import sys
+from collections import Counter
+
+import assembler
+
+
+def split_c(line):
+    """
+    Splits a C-instruction into its parts
+    :param line: cleaned C-instruction
+    :return: (dest, comp, jump), dest and jump are '' when absent
+    """
+    dest, eq, comp = line.rpartition('=')
+    comp, semi, jump = comp.partition(';')
+    return dest, comp, jump
+
+
+def normalize(line):
+    """
+    Rewrites a cleaned line into the spelling the passes match against,
+    e.g. 'DM = M+D' becomes 'MD=D+M'
+    :param line:
+    :return:
+    """
+    if line[0] in '@(':
+        return line
+    dest, comp, jump = split_c(''.join(line.split()))
+    if dest:
+        dest = ''.join(sorted(dest, key='AMD'.find))
+    if (comp not in assembler.comp_0 and comp not in assembler.comp_1) or comp in ('A+D', 'M+D'):
+        comp = assembler.swap_operands(comp)
+    if dest:
+        comp = dest + '=' + comp
+    if jump:
+        comp = comp + ';' + jump
+    return comp
+
+
+def overwrites_a(line):
+    # the instruction sets A without looking at the old A, M or jumping through it
+    if line[0] == '@':
+        return True
+    if line[0] == '(':
+        return False
+    dest, comp, jump = split_c(line)
+    return dest == 'A' and not jump and 'A' not in comp and 'M' not in comp
+
+
+def previous_instruction(out, end):
+    # index of the last instruction before end, labels skipped
+    i = end - 1
+    while i >= 0 and out[i][0] == '(':
+        i -= 1
+    return i
+
+
+def is_jump(line):
+    return line[0] not in '@(' and ';' in line
+
+
+def is_halt_loop(labels, body):
+    # (X) @X 0;JMP, the emulators only see a halt when the @X is there
+    if len(body) < 2 or body[0][0] != '@' or body[0][1:] not in labels:
+        return False
+    dest, comp, jump = split_c(body[1])
+    return not dest and jump == 'JMP'
+
+
+def split_blocks(lines):
+    """
+    Cuts a program into basic blocks
+    :param lines: cleaned source lines
+    :return: list of (labels, instructions), a block ends with its first jump
+    """
+    blocks = []
+    labels, body = [], []
+    for line in lines:
+        if line[0] == '(':
+            if body:
+                blocks.append((labels, body))
+                labels, body = [], []
+            labels.append(line[1:-1])
+        else:
+            body.append(line)
+            if is_jump(line):
+                blocks.append((labels, body))
+                labels, body = [], []
+    if labels or body:
+        blocks.append((labels, body))
+    return blocks
+
+
+def address_taken(lines, labels):
+    """
+    Labels loaded for anything but the jump right after them, e.g. return addresses.
+    Jumps through a computed A can only land on these
+    :param lines: cleaned source lines
+    :param labels: every label of the program
+    :return: set of labels
+    """
+    taken = set()
+    for i, line in enumerate(lines):
+        if line[0] != '@' or line[1:] not in labels:
+            continue
+        following = lines[i + 1] if i + 1 < len(lines) else '@'
+        if following[0] in '@(':
+            taken.add(line[1:])
+            continue
+        dest, comp, jump = split_c(following)
+        if not jump or 'A' in dest or 'A' in comp:
+            taken.add(line[1:])
+    return taken
+
+
+def _push_pop(out, keep):
+    # a push followed by a pop, SP goes up and straight back down
+    # (the @SP in between is already gone by the reload rule)
+    if out[-2:] == ['M=M+1', 'AM=M-1']:
+        out[-2:] = ['A=M']
+        return 1
+    return 0
+
+
+def _push_drop(out, keep):
+    # a push followed by pop constant, SP comes back where it was
+    if out[-2:] == ['M=M+1', 'M=M-1']:
+        del out[-2:]
+        return 2
+    return 0
+
+
+def _dead_load(out, keep):
+    # an @X whose value is overwritten before anything reads it
+    if not overwrites_a(out[-1]):
+        return 0
+    i = previous_instruction(out, len(out) - 1)
+    if i >= 0 and out[i][0] == '@' and out[i][1:] not in keep:
+        del out[i]
+        return 1
+    return 0
+
+
+def _reload(out, keep):
+    # @X, an instruction that leaves A alone, @X again
+    if len(out) < 3 or out[-1][0] != '@' or out[-3] != out[-1]:
+        return 0
+    middle = out[-2]
+    if middle[0] in '@(' or 'A' in split_c(middle)[0]:
+        return 0
+    del out[-1]
+    return 1
+
+
+def _store_load(out, keep):
+    # M=D then D=M, or D=M then M=D, with the same A
+    if out[-2:] == ['M=D', 'D=M'] or out[-2:] == ['D=M', 'M=D']:
+        del out[-1]
+        return 1
+    return 0
+
+
+RULES = [('push-pop', _push_pop), ('push-drop', _push_drop), ('dead-load', _dead_load),
+         ('reload', _reload), ('store-load', _store_load)]
+
+
+def peephole(lines, report=None, keep=()):
+    """
+    Pattern based clean up of straight line code. Patterns never look across a label,
+    except for dead loads where the label does not change what runs next
+    :param lines: cleaned and normalized source lines
+    :param report: Counter of removed instructions per rule, updated in place
+    :param keep: symbols whose A-instructions must stay
+    :return: the optimised lines
+    """
+    if report is None:
+        report = Counter()
+    out = []
+    for line in lines:
+        out.append(line)
+        changed = True
+        while changed and out:
+            changed = False
+            for name, rule in RULES:
+                removed = rule(out, keep)
+                if removed:
+                    report[name] += removed
+                    changed = True
+                    break
+    return out
+
+
+# value of every comp, x is D and y is A or M
+COMP_EVAL = {'0': lambda x, y: 0, '1': lambda x, y: 1, '-1': lambda x, y: -1,
+             'D': lambda x, y: x, 'A': lambda x, y: y, 'M': lambda x, y: y,
+             '!D': lambda x, y: ~x, '!A': lambda x, y: ~y, '!M': lambda x, y: ~y,
+             '-D': lambda x, y: -x, '-A': lambda x, y: -y, '-M': lambda x, y: -y,
+             'D+1': lambda x, y: x + 1, 'A+1': lambda x, y: y + 1, 'M+1': lambda x, y: y + 1,
+             'D-1': lambda x, y: x - 1, 'A-1': lambda x, y: y - 1, 'M-1': lambda x, y: y - 1,
+             'D+A': lambda x, y: x + y, 'D+M': lambda x, y: x + y,
+             'D-A': lambda x, y: x - y, 'D-M': lambda x, y: x - y,
+             'A-D': lambda x, y: y - x, 'M-D': lambda x, y: y - x,
+             'D&A': lambda x, y: x & y, 'D&M': lambda x, y: x & y,
+             'D|A': lambda x, y: x | y, 'D|M': lambda x, y: x | y}
+
+# addresses below this are the pointer and general purpose registers
+REGISTERS = 16
+
+# facts known about a register, the sets of facts are intersected where control flow meets
+#   ('c', k)  holds the constant k, an int or a symbol
+#   ('m', k)  holds the contents of RAM[k] for a constant k
+#   ('M',)    holds the contents of RAM[A]
+#   ('s',)    holds an address on the VM stack, never one of the registers
+IN_RAM = ('M',)
+ON_STACK = ('s',)
+NOTHING = frozenset()
+
+
+def wrap(value):
+    # 16 bit two's complement
+    return ((value + 0x8000) & 0xFFFF) - 0x8000
+
+
+class RegisterState:
+    """
+    What is known about A, D and constant RAM addresses at one point of the program
+    """
+
+    def __init__(self, a=NOTHING, d=NOTHING, mem=None):
+        self.a = a
+        self.d = d
+        self.mem = mem if mem is not None else {}
+
+    def meet(self, other):
+        """
+        Keeps the facts that hold on both paths
+        :param other: RegisterState or None for a path that is never taken
+        :return:
+        """
+        if other is None:
+            return self
+        mem = {}
+        for key, facts in self.mem.items():
+            if key in other.mem:
+                facts = facts & other.mem[key]
+                if facts:
+                    mem[key] = facts
+        return RegisterState(self.a & other.a, self.d & other.d, mem)
+
+    def __eq__(self, other):
+        return other is not None and self.a == other.a and self.d == other.d and self.mem == other.mem
+
+
+class RegisterTracker:
+    """
+    Forward dataflow over the basic blocks of a program, following what A and D hold so that
+    instructions which would load a value the register already has can be dropped.
+
+    Control only enters a label from the instruction above it or from a jump whose target is a
+    constant @label. Labels whose address is used in any other way (return addresses) are assumed
+    to be reachable from anywhere and start with nothing known. With trust_sp the VM convention
+    that SP points above the registers is assumed, so stack writes leave R0..R15 facts alone.
+    That only holds for translator output, so it is off unless asked for.
+    """
+
+    def __init__(self, lines, trust_sp=False, keep=()):
+        self.trust_sp = trust_sp
+        self.keep = keep
+        self.labels = set(line[1:-1] for line in lines if line[0] == '(')
+        self.taken = address_taken(lines, self.labels)
+        self.blocks = split_blocks(lines)
+
+    def key(self, symbol):
+        """
+        RAM address named by an A-instruction, an int when it is known before assembly
+        :param symbol:
+        :return:
+        """
+        if symbol.isdigit():
+            return wrap(int(symbol))
+        return assembler.PREDEFINED.get(symbol, symbol)
+
+    def may_alias(self, key, other):
+        if key == other:
+            return True
+        if isinstance(key, int) and isinstance(other, int):
+            return False
+        if isinstance(key, str) and isinstance(other, str):
+            # variables are all different, a label can sit anywhere
+            return key in self.labels or other in self.labels
+        symbol, number = (key, other) if isinstance(key, str) else (other, key)
+        return symbol in self.labels or number >= REGISTERS
+
+    def address(self, facts):
+        # the constant in a set of facts about A
+        for fact in facts:
+            if fact[0] == 'c':
+                return fact[1]
+        return None
+
+    def value(self, comp, state):
+        """
+        Facts about the result of a comp
+        :param comp: normalized comp
+        :param state: RegisterState before the instruction
+        :return: frozenset of facts
+        """
+        if comp == 'D':
+            return state.d
+        if comp == 'A':
+            return state.a
+        facts = set()
+        if comp == 'M':
+            facts.add(IN_RAM)
+            k = self.address(state.a)
+            if k is not None:
+                facts.add(('m', k))
+                facts |= state.mem.get(k, NOTHING)
+        if self.trust_sp:
+            if comp in ('M', 'M+1', 'M-1') and ('c', 0) in state.a:
+                facts.add(ON_STACK)
+            elif comp in ('A', 'A+1', 'A-1') and ON_STACK in state.a:
+                facts.add(ON_STACK)
+        fold = COMP_EVAL.get(comp)
+        if fold is not None:
+            x = y = 0
+            if 'D' in comp:
+                x = self.address(state.d)
+            if 'A' in comp:
+                y = self.address(state.a)
+            elif 'M' in comp:
+                y = None
+                if comp != 'M':
+                    k = self.address(state.a)
+                    y = self.address(state.mem.get(k, NOTHING)) if k is not None else None
+            if isinstance(x, int) and isinstance(y, int):
+                facts.add(('c', wrap(fold(x, y))))
+        return frozenset(facts)
+
+    def _killer(self, a):
+        # which RAM facts a write through A destroys
+        k = self.address(a)
+        if k is not None:
+            return lambda key: self.may_alias(key, k)
+        if self.trust_sp and ON_STACK in a:
+            return lambda key: not (isinstance(key, int) and 0 <= key < REGISTERS)
+        return lambda key: True
+
+    def _forget(self, facts, killed):
+        return frozenset(f for f in facts if f != IN_RAM and not (f[0] == 'm' and killed(f[1])))
+
+    def step(self, line, state):
+        """
+        State after one instruction
+        :param line: normalized instruction
+        :param state: RegisterState before it
+        :return: RegisterState after it
+        """
+        if line[0] == '@':
+            d = state.d - {IN_RAM} if IN_RAM in state.d else state.d
+            return RegisterState(frozenset([('c', self.key(line[1:]))]), d, state.mem)
+        dest, comp, jump = split_c(line)
+        if not dest:
+            return state
+        val = self.value(comp, state)
+        a, d, mem = state.a, state.d, state.mem
+        if 'M' in dest:
+            killed = self._killer(a)
+            k = self.address(a)
+            mem = dict((key, facts) for key, facts in mem.items() if not killed(key))
+            a, d, val = self._forget(a, killed), self._forget(d, killed), self._forget(val, killed)
+            consts = frozenset(f for f in val if f[0] == 'c')
+            val = val | {IN_RAM}
+            if k is not None:
+                val = val | {('m', k)}
+                if consts:
+                    mem[k] = consts
+            if comp == 'D':
+                d = val
+            elif comp == 'A':
+                a = val
+        if 'D' in dest:
+            d = val
+        if 'A' in dest:
+            a = val - {IN_RAM}
+            d = d - {IN_RAM}
+        return RegisterState(a, d, mem)
+
+    def redundant(self, line, state):
+        """
+        Does the instruction leave A, D and RAM as they are
+        :param line: normalized instruction
+        :param state: RegisterState before it
+        :return:
+        """
+        if line[0] == '@':
+            return line[1:] not in self.keep and ('c', self.key(line[1:])) in state.a
+        dest, comp, jump = split_c(line)
+        if jump or not dest:
+            return False
+        val = self.value(comp, state) - {ON_STACK}
+        if 'A' in dest and not val & state.a:
+            return False
+        if 'D' in dest and not val & state.d:
+            return False
+        if 'M' in dest and IN_RAM not in val:
+            return False
+        return True
+
+    def _target(self, state):
+        # labels a jump can land on, None when it is not a constant label
+        k = self.address(state.a)
+        if isinstance(k, str) and k in self.labels:
+            return k
+        return None
+
+    def _run_block(self, body, state, edges):
+        for line in body:
+            before = state
+            state = self.step(line, state)
+            if is_jump(line):
+                target = self._target(before)
+                if target is not None:
+                    edges.setdefault(target, []).append(state)
+                elif self.address(before.a) not in (None, 0):
+                    raise ValueError("jump to a numeric address")
+        return state
+
+    def _falls_through(self, body):
+        return not body or not body[-1].endswith(';JMP')
+
+    def solve(self, limit=100):
+        """
+        State at the start of every block
+        :param limit: rounds before giving up and assuming nothing anywhere
+        :return: list of RegisterState, None for blocks that are never reached
+        """
+        n = len(self.blocks)
+        states = [None] * n
+        for _ in range(limit):
+            edges = {}
+            outs = [None] * n
+            for i, (labels, body) in enumerate(self.blocks):
+                if states[i] is not None:
+                    outs[i] = self._run_block(body, states[i], edges)
+            changed = False
+            for i, (labels, body) in enumerate(self.blocks):
+                state = self._entry(i, labels, outs, edges)
+                if state != states[i] and not (state is None and states[i] is None):
+                    states[i] = state
+                    changed = True
+            if not changed:
+                return states
+        return [RegisterState() for block in self.blocks]
+
+    def _entry(self, i, labels, outs, edges):
+        if i == 0 or any(label in self.taken for label in labels):
+            return RegisterState()
+        incoming = []
+        if self._falls_through(self.blocks[i - 1][1]):
+            incoming.append(outs[i - 1])
+        for label in labels:
+            incoming += edges.get(label, [])
+        incoming = [state for state in incoming if state is not None]
+        if not incoming:
+            return None
+        state = incoming[0]
+        for other in incoming[1:]:
+            state = state.meet(other)
+        return state
+
+    def rewrite(self, report):
+        """
+        Drops the redundant instructions
+        :param report: Counter of removed instructions per rule
+        :return: the optimised lines
+        """
+        out = []
+        for (labels, body), state in zip(self.blocks, self.solve()):
+            out += ['(' + label + ')' for label in labels]
+            if state is None:
+                out += body
+                continue
+            i = 0
+            # the load of a halt loop stays, it is redundant only to the CPU
+            if is_halt_loop(labels, body):
+                state = self.step(body[0], state)
+                out.append(body[0])
+                i = 1
+            while i < len(body):
+                line = body[i]
+                if self.redundant(line, state):
+                    report['known-value'] += 1
+                    i += 1
+                    continue
+                if line[0] == '@' and i + 1 < len(body) and self._redundant_pair(line, body[i + 1], state):
+                    report['known-address'] += 2
+                    i += 2
+                    continue
+                state = self.step(line, state)
+                out.append(line)
+                i += 1
+        return out
+
+    def _redundant_pair(self, load, line, state):
+        # @X then A=<comp> that recomputes the A we already have
+        if line[0] in '@(' or load[1:] in self.keep:
+            return False
+        dest, comp, jump = split_c(line)
+        if dest != 'A' or jump:
+            return False
+        return bool((self.value(comp, self.step(load, state)) - {ON_STACK}) & state.a)
+
+
+def track_registers(lines, report=None, trust_sp=False, keep=()):
+    """
+    Removes A-instructions and recomputations of values A or D provably already hold
+    :param lines: cleaned and normalized source lines
+    :param report: Counter of removed instructions per rule, updated in place
+    :param trust_sp: assume the VM convention that SP never points at R0..R15
+    :param keep: symbols whose A-instructions must stay
+    :return: the optimised lines
+    """
+    if report is None:
+        report = Counter()
+    tracker = RegisterTracker(lines, trust_sp, keep)
+    try:
+        return tracker.rewrite(report)
+    except ValueError:
+        # jumps to numeric addresses can land anywhere, nothing is safe to remove
+        return lines
+
+
+def reads_a_on_entry(body):
+    # does the block look at the A it was entered with
+    for line in body:
+        if overwrites_a(line):
+            return False
+        dest, comp, jump = split_c(line)
+        if 'A' in comp or 'M' in comp or 'M' in dest or jump:
+            return True
+    return True
+
+
+class BlockLayout:
+    """
+    Control flow graph of a program, used to thread jumps to jumps, drop jumps to the next
+    instruction, remove unreachable blocks and order blocks so that gotos become fall throughs.
+
+    Like RegisterTracker, jumps through a computed A are assumed to land on labels whose address
+    is taken, and these blocks always count as reachable.
+    """
+
+    def __init__(self, lines, keep=()):
+        self.keep = keep
+        self.labels = set(line[1:-1] for line in lines if line[0] == '(')
+        self.taken = address_taken(lines, self.labels)
+        self.blocks = [(list(labels), list(body)) for labels, body in split_blocks(lines)]
+
+    def jump(self, body):
+        """
+        The direct jump a block ends with
+        :param body: block instructions
+        :return: (label, unconditional, removable) or None when the block does not end in '@label, comp;jump',
+                 removable jumps have no dest and can be left out without changing anything but A
+        """
+        if len(body) < 2 or not is_jump(body[-1]):
+            return None
+        dest, comp, jump = split_c(body[-1])
+        target = body[-2]
+        if target[0] != '@':
+            return None
+        if target[1:] not in self.labels:
+            if target[1:] != '0':
+                raise ValueError("jump to a numeric address")
+            return None
+        return target[1:], jump == 'JMP', not dest
+
+    def _ends_with_goto(self, body):
+        return bool(body) and body[-1].endswith(';JMP')
+
+    def _index(self):
+        return dict((label, i) for i, (labels, body) in enumerate(self.blocks) for label in labels)
+
+    def thread(self, report):
+        # a jump to a block that only jumps on goes straight to the final target, as long as nothing
+        # but the jump sees the changed A: no dest or comp reading it and, for a conditional jump,
+        # a fall through block that sets A before looking at it
+        index = self._index()
+        for i, (labels, body) in enumerate(self.blocks):
+            jump = self.jump(body)
+            if jump is None or not jump[2]:
+                continue
+            dest, comp, condition = split_c(body[-1])
+            if 'A' in comp or 'M' in comp:
+                continue
+            if not jump[1] and i + 1 < len(self.blocks) and reads_a_on_entry(self.blocks[i + 1][1]):
+                continue
+            label, seen = jump[0], set()
+            while label not in seen:
+                seen.add(label)
+                target = self.blocks[index[label]][1]
+                hop = self.jump(target)
+                if len(target) != 2 or hop is None or not hop[1] or not hop[2]:
+                    break
+                label = hop[0]
+            if label != jump[0]:
+                body[-2] = '@' + label
+
+    def prune(self, report):
+        # blocks control can never reach
+        index = self._index()
+        live = set([0]) | set(index[label] for label in self.taken)
+        work = list(live)
+        while work:
+            i = work.pop()
+            labels, body = self.blocks[i]
+            nxt = []
+            if not self._ends_with_goto(body) and i + 1 < len(self.blocks):
+                nxt.append(i + 1)
+            jump = self.jump(body)
+            if jump is not None:
+                nxt.append(index[jump[0]])
+            for j in nxt:
+                if j not in live:
+                    live.add(j)
+                    work.append(j)
+        kept = []
+        orphans = []
+        for i, (labels, body) in enumerate(self.blocks):
+            pinned = any(line[0] == '@' and line[1:] in self.keep for line in body)
+            if i in live or pinned:
+                kept.append((orphans + labels, body))
+                orphans = []
+            else:
+                report['unreachable'] += len(body)
+                orphans += labels
+        if orphans:
+            kept.append((orphans, []))
+        self.blocks = kept
+
+    def arrange(self, report):
+        # chains of blocks, a goto whose target has no other way in is replaced by placing the target next
+        n = len(self.blocks)
+        index = self._index()
+        fall_in = set(i + 1 for i, (labels, body) in enumerate(self.blocks) if not self._ends_with_goto(body))
+        # the blocks that fall through to the end of the ROM have to stay last, moved up they would
+        # fall into other code instead of stopping
+        tail = n
+        while tail > 0 and not self._ends_with_goto(self.blocks[tail - 1][1]):
+            tail -= 1
+        placed = [False] * n
+        order = []
+        for start in range(n):
+            i = start
+            while i is not None and not placed[i]:
+                placed[i] = True
+                order.append(i)
+                labels, body = self.blocks[i]
+                if not self._ends_with_goto(body):
+                    i = i + 1 if i + 1 < n else None
+                    continue
+                jump = self.jump(body)
+                i = None
+                if jump is None or not jump[2]:
+                    continue
+                t = index[jump[0]]
+                target_labels, target = self.blocks[t]
+                if placed[t] or t in fall_in or t == 0 or t >= tail or reads_a_on_entry(target):
+                    continue
+                del body[-2:]
+                report['goto-layout'] += 2
+                i = t
+        self.blocks = [self.blocks[i] for i in order]
+
+    def drop_jumps_to_next(self, report):
+        # @L, comp;jump straight into (L)
+        for i in range(len(self.blocks) - 1):
+            labels, body = self.blocks[i]
+            jump = self.jump(body)
+            following_labels, following = self.blocks[i + 1]
+            if jump is not None and jump[2] and jump[0] in following_labels and not reads_a_on_entry(following):
+                del body[-2:]
+                report['jump-to-next'] += 2
+
+    def lines(self):
+        out = []
+        for labels, body in self.blocks:
+            out += ['(' + label + ')' for label in labels]
+            out += body
+        return out
+
+
+def layout_blocks(lines, report=None, keep=()):
+    """
+    Threads jump chains, removes unreachable code and lays blocks out for fall through
+    :param lines: cleaned and normalized source lines
+    :param report: Counter of removed instructions per rule, updated in place
+    :param keep: symbols whose A-instructions must stay
+    :return: the optimised lines
+    """
+    if report is None:
+        report = Counter()
+    layout = BlockLayout(lines, keep)
+    try:
+        layout.thread(report)
+        layout.prune(report)
+        layout.arrange(report)
+        layout.drop_jumps_to_next(report)
+    except ValueError:
+        # jumps to numeric addresses can land anywhere, blocks have to stay where they are
+        return lines
+    return layout.lines()
+
+
+def variables(lines):
+    """
+    Variable symbols in the order the assembler gives them RAM
+    :param lines: cleaned source lines
+    :return: list of symbols
+    """
+    labels = set(line[1:-1] for line in lines if line[0] == '(')
+    order = []
+    seen = set()
+    for line in lines:
+        if line[0] == '@':
+            symbol = line[1:]
+            if symbol in seen or symbol.isdigit() or symbol in labels or symbol in assembler.PREDEFINED:
+                continue
+            seen.add(symbol)
+            order.append(symbol)
+    return order
+
+
+def optimize(source_lines, report=None, trust_sp=False):
+    """
+    Runs every pass over a program
+    :param source_lines: lines of Hack assembly, comments and blank lines allowed
+    :param report: Counter of removed instructions per rule, updated in place
+    :param trust_sp: assume the VM convention that SP never points at R0..R15, only for
+    translator output
+    :return: the optimised lines
+    """
+    lines = [normalize(line) for line in map(assembler.clean, source_lines) if line]
+    order = variables(lines)
+    keep = set()
+    while True:
+        found = Counter()
+        out = peephole(lines, found, keep)
+        out = layout_blocks(out, found, keep)
+        out = track_registers(out, found, trust_sp, keep)
+        out = peephole(out, found, keep)
+        # the assembler allocates variables in order of first use, that order has to survive
+        new_order = variables(out)
+        if new_order == order:
+            break
+        i = 0
+        while i < len(new_order) and new_order[i] == order[i]:
+            i += 1
+        keep |= set(order[i:])
+    if report is not None:
+        report.update(found)
+    return out
+
+
+def print_report(report, before, after):
+    for name, removed in report.most_common():
+        print('{n:<14}{r:>8}'.format(n=name, r=removed))
+    print('{n:<14}{b:>8} -> {a}'.format(n='instructions', b=before, a=after))
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    trust_sp = '-sp' in args
+    if trust_sp:
+        args.remove('-sp')
+    path = args[0]
+    with open(path, 'r', encoding='ascii') as f:
+        source = f.readlines()
+    report = Counter()
+    lines = optimize(source, report, trust_sp)
+    with open(assembler.output_name(path, '.opt.asm'), 'w') as out:
+        out.write('\n'.join(lines) + '\n')
+    before = sum(1 for line in map(assembler.clean, source) if line and line[0] != '(')
+    print_report(report, before, sum(1 for line in lines if line[0] != '('))
@@ -0,0 +1,155 @@
+"""
+Where the cycles of a Hack program go. Executions are counted per ROM address and summed per
+label and per VM function, using the label table of the assembler.
+
+python profiler.py filename.asm [cycles] [-json out.json] [-top N]
+prints the report, a .hack file can be profiled too but only by address
+"""
+import json
+import sys
+
+import assembler
+import emulator
+import rom
+
+NO_LABEL = '(start)'
+
+
+def is_function(label):
+    # VM function labels are Class.sub, the labels inside a function are Class.sub$name
+    return '.' in label and '$' not in label
+
+
+def owners(labels, size, accept=None):
+    """
+    Names every ROM address after the closest label at or above it
+    :param labels: label name -> ROM address
+    :param size: number of instructions
+    :param accept: only labels for which this returns True are used, all when None
+    :return: list of names, NO_LABEL before the first label
+    """
+    names = [NO_LABEL] * size
+    # the last label written at an address wins
+    marks = {}
+    for label, address in labels.items():
+        if accept is None or accept(label):
+            marks[address] = label
+    name = NO_LABEL
+    for address in range(size):
+        name = marks.get(address, name)
+        names[address] = name
+    return names
+
+
+class Profile:
+    """
+    Execution counts of one run
+    """
+
+    def __init__(self, hits, labels, size, halted=False):
+        """
+        :param hits: executions per ROM address
+        :param labels: label name -> ROM address, may be empty
+        :param size: number of instructions
+        :param halted: the run reached a halt loop or left the ROM, the budget did not stop it
+        """
+        self.hits = hits
+        self.labels = labels
+        self.size = size
+        self.halted = halted
+        self.cycles = sum(hits)
+
+    def by_address(self):
+        """
+        :return: {address: count} of the executed addresses
+        """
+        return {address: count for address, count in enumerate(self.hits[:self.size]) if count}
+
+    def aggregate(self, accept=None):
+        totals = {}
+        for name, count in zip(owners(self.labels, self.size, accept), self.hits):
+            if count:
+                totals[name] = totals.get(name, 0) + count
+        return dict(sorted(totals.items(), key=lambda item: -item[1]))
+
+    def by_label(self):
+        """
+        :return: {label: count}, largest first
+        """
+        return self.aggregate()
+
+    def by_function(self):
+        """
+        :return: {VM function: count}, largest first
+        """
+        return self.aggregate(is_function)
+
+    def table(self, title, totals, top):
+        lines = ['{t:<40}{c:>12}{p:>8}'.format(t=title, c='cycles', p='%')]
+        for name, count in list(totals.items())[:top]:
+            lines.append('{n:<40}{c:>12}{p:>7.2f}%'.format(n=name, c=count, p=100.0 * count / max(self.cycles, 1)))
+        return lines
+
+    def report(self, top=20):
+        """
+        :param top: rows per table
+        :return: text report sorted by cycles
+        """
+        lines = ['cycles {c}{h}'.format(c=self.cycles, h='' if self.halted else ', stopped by the cycle budget'), '']
+        if self.labels:
+            lines += self.table('function', self.by_function(), top) + ['']
+            lines += self.table('label', self.by_label(), top) + ['']
+        addresses = dict(sorted(self.by_address().items(), key=lambda item: -item[1]))
+        lines += self.table('address', addresses, top)
+        return '\n'.join(lines)
+
+    def to_json(self):
+        """
+        :return: dict with the cycles, whether the run halted and the counts by function, label and address
+        """
+        return {'cycles': self.cycles, 'halted': self.halted, 'functions': self.by_function(), 'labels': self.by_label(),
+                'addresses': {str(address): count for address, count in self.by_address().items()}}
+
+
+def profile(words, labels, cycles):
+    """
+    Runs a program with counting on until it halts, the halt loop itself is not counted
+    :param words: sequence of unsigned 16 bit instructions
+    :param labels: label name -> ROM address
+    :param cycles: maximum number of instructions
+    :return: Profile
+    """
+    machine = emulator.Emulator(words)
+    hits = [0] * emulator.ROM_SIZE
+    machine.run_profiled(cycles, hits)
+    return Profile(hits, labels, len(words), machine.halted)
+
+
+def load_program(path):
+    """
+    ROM and symbols of a program, symbols are only known when assembling from source
+    :param path: .asm, .hack or .hackb file name
+    :return: (words, labels, variables)
+    """
+    if path.endswith(assembler.ASM_FILE):
+        asm = assembler.Assembler()
+        with open(path, 'r', encoding='ascii') as f:
+            words = asm.assemble(f)
+        return words, asm.labels, asm.variables
+    return rom.load_rom(path), {}, {}
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    options = {}
+    for option in ('-json', '-top'):
+        if option in args:
+            i = args.index(option)
+            options[option] = args[i + 1]
+            del args[i:i + 2]
+    words, labels, _ = load_program(args[0])
+    result = profile(words, labels, int(args[1]) if len(args) > 1 else 10 ** 7)
+    print(result.report(int(options.get('-top', 20))))
+    if '-json' in options:
+        with open(options['-json'], 'w') as out:
+            json.dump(result.to_json(), out, indent=1)
@@ -0,0 +1,94 @@
+"""
+ROM file formats produced by the assembler
+
+.hack   one 16 character binary string per instruction
+.hackb  a 12 byte header followed by the instructions as packed little-endian uint16
+"""
+import mmap
+import struct
+import sys
+from array import array
+
+HACK_FILE = ".hack"
+HACKB_FILE = ".hackb"
+
+MAGIC = b'HACK'
+VERSION = 1
+# magic, version, flags (unused), number of instructions
+HEADER = struct.Struct('<4sHHI')
+
+# number of words packed per write
+CHUNK = 4096
+
+
+def write_hackb(words, path):
+    """
+    Writes the instructions as a packed .hackb file
+    :param words: iterable of 16 bit instruction values
+    :param path: output file name
+    :return: number of instructions written
+    """
+    count = 0
+    with open(path, 'wb') as out:
+        # the count is patched once the words are all written
+        out.write(HEADER.pack(MAGIC, VERSION, 0, 0))
+        chunk = array('H')
+        for word in words:
+            chunk.append(word)
+            if len(chunk) == CHUNK:
+                count += _write_chunk(out, chunk)
+                chunk = array('H')
+        count += _write_chunk(out, chunk)
+        out.seek(0)
+        out.write(HEADER.pack(MAGIC, VERSION, 0, count))
+    return count
+
+
+def _write_chunk(out, chunk):
+    if sys.byteorder == 'big':
+        chunk.byteswap()
+    out.write(chunk.tobytes())
+    return len(chunk)
+
+
+def load_hackb(path):
+    """
+    Maps a .hackb file into memory without copying it
+    :param path: .hackb file name
+    :return: memoryview of unsigned 16 bit words
+    """
+    with open(path, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, _, count = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise Exception("Not a .hackb file: " + path)
+    end = HEADER.size + 2 * count
+    if len(data) < end:
+        raise Exception("Truncated .hackb file: " + path)
+    if sys.byteorder == 'big':
+        # the file is little-endian, only here a copy is needed
+        words = array('H', data[HEADER.size:end])
+        words.byteswap()
+        return memoryview(words)
+    return memoryview(data)[HEADER.size:end].cast('H')
+
+
+def load_hack(path):
+    """
+    Parses a text .hack file
+    :param path: .hack file name
+    :return: array of unsigned 16 bit words
+    """
+    with open(path, 'r', encoding='ascii') as f:
+        return array('H', [int(line, 2) for line in f if line.strip()])
+
+
+def load_rom(path):
+    """
+    Loads a ROM in either format, chosen by the file extension
+    :param path: .hack or .hackb file name
+    :return: sequence of unsigned 16 bit words
+    """
+    if path.endswith(HACKB_FILE):
+        return load_hackb(path)
+    return load_hack(path)
@@ -0,0 +1,156 @@
+"""
+The Hack screen as a NumPy view of emulator RAM. Pixel (r, c) is bit c % 16 of word
+SCREEN + 32 * r + c // 16, 1 is black. Nothing is copied until a bitmap or a frame is asked for,
+and frames only re-encode the rows that changed since the last one.
+
+python screen.py filename.hack framedir [cycles] [-every N] [-png]
+runs the program and writes a PBM (or PNG) frame every N cycles when the screen changed
+"""
+import os
+import struct
+import sys
+import zlib
+
+import numpy as np
+
+import assembler
+import jit
+
+SCREEN = assembler.PREDEFINED['SCREEN']
+KBD = assembler.PREDEFINED['KBD']
+WIDTH = 512
+HEIGHT = 256
+ROW_WORDS = WIDTH // 16
+
+# PBM and PNG want the leftmost pixel in the high bit, Hack keeps it in the low bit
+REVERSE = np.array([int('{:08b}'.format(byte)[::-1], 2) for byte in range(256)], dtype=np.uint8)
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def png_chunk(kind, data):
+    # length, type, data, crc of type and data
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+class Screen:
+    """
+    Framebuffer over the RAM of an emulator. The view shares memory with RAM, a shadow copy of
+    the last encoded frame tells which rows are dirty
+    """
+
+    def __init__(self, ram):
+        """
+        :param ram: emulator RAM, an array('h') or a NumPy int16 vector
+        """
+        self.ram = ram
+        self.words = np.frombuffer(ram, dtype=np.int16)[SCREEN:SCREEN + HEIGHT * ROW_WORDS].reshape(HEIGHT, ROW_WORDS)
+        self.shadow = np.zeros_like(self.words)
+        # encoded rows of the last frame, 1 bit per pixel with the leftmost pixel first
+        self.rows = np.zeros((HEIGHT, ROW_WORDS * 2), dtype=np.uint8)
+
+    def key(self, code):
+        """
+        Presses a key, 0 releases it
+        :param code: Hack character set code
+        :return:
+        """
+        self.ram[KBD] = code
+
+    def dirty_rows(self):
+        """
+        :return: indices of the rows written since the last frame
+        """
+        return np.flatnonzero((self.words != self.shadow).any(axis=1))
+
+    def bitmap(self):
+        """
+        Unpacks the current screen
+        :return: (256, 512) uint8 array, 1 for black
+        """
+        data = self.words.astype('<i2', copy=False).view(np.uint8)
+        return np.unpackbits(data, axis=1, bitorder='little')
+
+    def update(self):
+        """
+        Re-encodes the dirty rows
+        :return: number of rows that changed
+        """
+        dirty = self.dirty_rows()
+        if len(dirty):
+            words = self.words[dirty]
+            self.shadow[dirty] = words
+            self.rows[dirty] = REVERSE[words.astype('<i2', copy=False).view(np.uint8)]
+        return len(dirty)
+
+    def pbm(self):
+        """
+        :return: the screen as a binary PBM image
+        """
+        self.update()
+        return b'P4\n%d %d\n' % (WIDTH, HEIGHT) + self.rows.tobytes()
+
+    def png(self):
+        """
+        :return: the screen as a 1 bit grayscale PNG image
+        """
+        self.update()
+        # PNG grayscale has 0 for black, each scanline starts with filter type 0
+        lines = np.empty((HEIGHT, ROW_WORDS * 2 + 1), dtype=np.uint8)
+        lines[:, 0] = 0
+        lines[:, 1:] = ~self.rows
+        header = struct.pack('>IIBBBBB', WIDTH, HEIGHT, 1, 0, 0, 0, 0)
+        return PNG_SIGNATURE + png_chunk(b'IHDR', header) + \
+            png_chunk(b'IDAT', zlib.compress(lines.tobytes())) + png_chunk(b'IEND', b'')
+
+
+class FrameWriter:
+    """
+    Writes numbered frames of a screen into a directory, unchanged screens are skipped
+    """
+
+    def __init__(self, screen, directory, extension='.pbm'):
+        """
+        :param screen: Screen to dump
+        :param directory: output directory, created if needed
+        :param extension: .pbm or .png
+        """
+        self.screen = screen
+        self.directory = directory
+        self.extension = extension
+        self.count = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def dump(self, force=False):
+        """
+        Writes the next frame if any row changed
+        :param force: write even an unchanged screen
+        :return: file name, None when nothing was written
+        """
+        if not force and self.count and not len(self.screen.dirty_rows()):
+            return None
+        data = self.screen.png() if self.extension == '.png' else self.screen.pbm()
+        path = os.path.join(self.directory, 'frame{n:05d}{e}'.format(n=self.count, e=self.extension))
+        with open(path, 'wb') as out:
+            out.write(data)
+        self.count += 1
+        return path
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    every = 10 ** 5
+    if '-every' in args:
+        i = args.index('-every')
+        every = int(args[i + 1])
+        del args[i:i + 2]
+    extension = '.png' if '-png' in args else '.pbm'
+    args = [arg for arg in args if not arg.startswith('-')]
+    machine = jit.JitEmulator.load(args[0])
+    cycles = int(args[2]) if len(args) > 2 else 10 ** 7
+    frames = FrameWriter(Screen(machine.ram), args[1], extension)
+    while machine.cycles < cycles and not machine.halted:
+        machine.run(min(every, cycles - machine.cycles))
+        frames.dump()
+    machine.save_cache()
+    print('cycles {c}  frames {f}'.format(c=machine.cycles, f=frames.count))
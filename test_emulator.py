@@ -0,0 +1,48 @@
+import unittest
+
+import assembler
+import emulator
+import jit
+
+STRAIGHT = ['@5', 'D=A', '@x', 'M=D']
+
+# a counted loop whose jump back is the last instruction
+COUNTED = ['@10', 'D=A', '(LOOP)', 'D=D-1', '@LOOP', 'D;JGT']
+
+
+class FallOffTest(unittest.TestCase):
+
+    def machines(self, lines):
+        words = assembler.assemble(lines)
+        return [emulator.Emulator(words), jit.JitEmulator(words, cache_dir=None)]
+
+    def test_halted_by_the_last_instruction(self):
+        for machine in self.machines(STRAIGHT):
+            self.assertEqual(machine.run(len(STRAIGHT)), len(STRAIGHT))
+            self.assertTrue(machine.halted)
+            self.assertEqual(machine.ram[16], 5)
+
+    def test_halted_in_a_larger_budget(self):
+        for machine in self.machines(STRAIGHT):
+            self.assertEqual(machine.run(100), len(STRAIGHT))
+            self.assertTrue(machine.halted)
+
+    def test_not_halted_before_the_end(self):
+        for machine in self.machines(STRAIGHT):
+            machine.run(len(STRAIGHT) - 1)
+            self.assertFalse(machine.halted)
+
+    def test_halted_by_a_loop_that_ends_the_rom(self):
+        for machine in self.machines(COUNTED):
+            self.assertEqual(machine.run(32), 32)
+            self.assertTrue(machine.halted)
+            self.assertEqual(machine.d, 0)
+
+    def test_halted_in_hooked_runs(self):
+        machine = emulator.Emulator(assembler.assemble(STRAIGHT))
+        machine.run_profiled(len(STRAIGHT), [0] * len(STRAIGHT))
+        self.assertTrue(machine.halted)
+
+
+if __name__ == '__main__':
+    unittest.main()
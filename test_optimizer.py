@@ -0,0 +1,186 @@
+import random
+import unittest
+from collections import Counter
+
+import assembler
+import emulator
+import optimizer
+import virtualMachine
+
+CYCLES = 20000
+
+VARIABLES = ['x', 'y', 'count', 'R1', 'R2']
+
+# straight line code that only addresses RAM through the A-instruction before it
+OPERATIONS = [['M=D'], ['D=M'], ['M=M+1'], ['D=D+M'], ['M=M-1', 'D=M'], ['D=D+1'], ['D=-D'], ['MD=M+1'],
+              ['D=D&M'], ['M=D|M']]
+CONDITIONS = ['D;JEQ', 'D;JNE', 'D;JGT', 'D;JLE', 'D;JLT', 'D;JGE']
+
+VM_BINARY = ['add', 'sub', 'and', 'or', 'eq', 'gt', 'lt']
+# RAM a VM program leaves its results in: temp, statics, and what this and that point at
+VM_RESULTS = [range(5, 13), range(16, 21), range(3000, 3010), range(3100, 3110)]
+
+
+def random_program(rnd):
+    """
+    Generates a Hack program of random blocks and jumps between them, every label and every jump is
+    followed by an A-instruction of a variable so that label addresses are never used as data
+    :param rnd: random.Random
+    :return: list of source lines
+    """
+    names = ['B%d' % i for i in range(rnd.randrange(2, 8))]
+    # the first uses fix the order the assembler allocates the variables in
+    lines = ['@x', '@y', '@%d' % rnd.randrange(1, 9), 'D=A', '@count', 'M=D']
+    for name in names:
+        lines += ['(%s)' % name, '@' + rnd.choice(VARIABLES)]
+        for _ in range(rnd.randrange(0, 4)):
+            lines += rnd.choice(OPERATIONS)
+            if rnd.random() < 0.5:
+                lines.append('@' + rnd.choice(VARIABLES))
+        if rnd.random() < 0.5:
+            lines += ['@count', 'MD=M-1']
+        kind = rnd.random()
+        if kind < 0.3:
+            lines += ['@' + rnd.choice(names), '0;JMP']
+        elif kind < 0.7:
+            lines += ['@' + rnd.choice(names), rnd.choice(CONDITIONS)]
+        else:
+            continue
+        lines.append('@' + rnd.choice(VARIABLES))
+    lines += ['(END)', '@END', '0;JMP']
+    return lines
+
+
+def random_vm_body(rnd, segments, calls, labels):
+    """
+    Generates VM commands that leave one value on the stack
+    :param rnd: random.Random
+    :param segments: dict of segment name to the number of its entries the body may use
+    :param calls: whether the body calls F.f
+    :param labels: list of labels used so far, updated in place
+    :return: list of command lines
+    """
+    lines = []
+    depth = 0
+    for _ in range(rnd.randrange(3, 40)):
+        kind = rnd.random()
+        if depth >= 2 and kind < 0.3:
+            lines.append(rnd.choice(VM_BINARY))
+            depth -= 1
+        elif depth >= 1 and kind < 0.4:
+            lines.append(rnd.choice(['neg', 'not']))
+        elif depth >= 1 and kind < 0.55:
+            segment = rnd.choice(sorted(segments))
+            lines.append('pop %s %d' % (segment, rnd.randrange(segments[segment])))
+            depth -= 1
+        elif depth >= 1 and kind < 0.6:
+            label = 'L%d' % len(labels)
+            labels.append(label)
+            lines += ['if-goto ' + label, 'push constant %d' % rnd.randrange(100), 'pop static 4',
+                      'label ' + label]
+            depth -= 1
+        elif depth >= 2 and calls and kind < 0.65:
+            lines.append('call F.f 2')
+            depth -= 1
+        elif kind < 0.75:
+            lines.append('push constant %d' % rnd.choice([0, 1, 2, 32767, rnd.randrange(32768)]))
+            depth += 1
+        else:
+            segment = rnd.choice(sorted(segments))
+            lines.append('push %s %d' % (segment, rnd.randrange(segments[segment])))
+            depth += 1
+    lines += ['add'] * (depth - 1) if depth else ['push constant 3']
+    return lines
+
+
+def random_vm_program(rnd):
+    """
+    Generates the assembly of a random VM program, Sys.init calls F.f and stops in a halt loop
+    :param rnd: random.Random
+    :return: list of source lines
+    """
+    segments = {'temp': 8, 'static': 5, 'this': 10, 'that': 10}
+    labels = []
+    sys_init = ['function Sys.init 4', 'push constant 3000', 'pop pointer 0',
+                'push constant 3100', 'pop pointer 1']
+    sys_init += random_vm_body(rnd, dict(segments, local=4), True, labels)
+    sys_init += ['pop static 0', 'label END', 'goto END']
+    f = ['function F.f 3'] + random_vm_body(rnd, dict(segments, local=3, argument=2), False, labels) + ['return']
+    translated = virtualMachine.translate_program([(sys_init, 'Sys'), (f, 'F')])
+    return ''.join(code for _, code in translated).split('\n')
+
+
+def vm_results(lines):
+    machine = emulator.Emulator(assembler.assemble(lines))
+    machine.run(10 ** 6)
+    return machine.halted, [machine.ram[address] for addresses in VM_RESULTS for address in addresses]
+
+
+def run(lines):
+    machine = emulator.Emulator(assembler.assemble(lines))
+    machine.run(CYCLES)
+    return machine.halted, list(machine.ram[:32])
+
+
+class ThreadTest(unittest.TestCase):
+
+    def thread(self, lines):
+        layout = optimizer.BlockLayout(lines)
+        layout.thread(Counter())
+        return layout.lines()
+
+    def test_threads_plain_jumps(self):
+        lines = ['@L', '0;JMP', '(L)', '@K', '0;JMP', '(K)', '@x', 'M=1']
+        self.assertEqual(self.thread(lines)[:2], ['@K', '0;JMP'])
+
+    def test_keeps_jumps_with_dest(self):
+        # M=D;JMP writes RAM[L], not RAM[K]
+        lines = ['D=1', '@L', 'M=D;JMP', '(L)', '@K', '0;JMP', '(K)', '@x', 'M=1']
+        self.assertEqual(self.thread(lines), lines)
+
+    def test_keeps_conditional_jumps_whose_fall_through_reads_a(self):
+        # M=1 after the jump writes to the address of L
+        lines = ['@L', 'D;JEQ', 'M=1', '(L)', '@K', '0;JMP', '(K)', '@x', 'M=1']
+        self.assertEqual(self.thread(lines), lines)
+
+    def test_threads_conditional_jumps_whose_fall_through_sets_a(self):
+        lines = ['@L', 'D;JEQ', '@x', 'M=1', '(L)', '@K', '0;JMP', '(K)', '@x', 'M=1']
+        self.assertEqual(self.thread(lines)[:2], ['@K', 'D;JEQ'])
+
+
+class OptimizeTest(unittest.TestCase):
+
+    def test_layout_keeps_results(self):
+        for seed in range(400):
+            lines = [optimizer.normalize(line) for line in random_program(random.Random(seed))]
+            halted, ram = run(lines)
+            if halted:
+                self.assertEqual(run(optimizer.layout_blocks(lines)), (True, ram), seed)
+
+    def test_registers_keep_results(self):
+        for seed in range(400):
+            lines = [optimizer.normalize(line) for line in random_program(random.Random(seed))]
+            halted, ram = run(lines)
+            if halted:
+                self.assertEqual(run(optimizer.track_registers(lines)), (True, ram), seed)
+
+    def test_optimize_keeps_results(self):
+        for seed in range(400):
+            lines = random_program(random.Random(seed))
+            halted, ram = run(lines)
+            if halted:
+                self.assertEqual(run(optimizer.optimize(lines)), (True, ram), seed)
+
+    def test_trust_sp_keeps_vm_results(self):
+        for seed in range(60):
+            lines = random_vm_program(random.Random(seed))
+            halted, results = vm_results(lines)
+            self.assertTrue(halted, seed)
+            normalized = [optimizer.normalize(line) for line in map(assembler.clean, lines) if line]
+            tracked = optimizer.track_registers(normalized, trust_sp=True)
+            self.assertEqual(vm_results(tracked), (True, results), seed)
+            self.assertEqual(vm_results(optimizer.optimize(lines, trust_sp=True)), (True, results), seed)
+
+
+if __name__ == '__main__':
+    unittest.main()
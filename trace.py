@@ -0,0 +1,301 @@
+"""
+Binary execution traces of the Hack emulator.
+
+A trace starts with a header and an emulator snapshot, then holds chunks of CHUNK_CYCLES cycles
+and ends with an index of the chunks. Every cycle is one varint of the PC step (zigzag of
+pc - previous pc - 1, shifted left once) with the low bit set when the instruction wrote RAM,
+followed for writes by the zigzag address step from the previous write and the value.
+Straight line code without writes costs one byte per cycle.
+
+python trace.py record filename.hack out.htr [cycles]
+python trace.py stats out.htr
+python trace.py seek out.htr cycle
+"""
+import mmap
+import struct
+import sys
+from array import array
+from collections import Counter
+
+import emulator
+import rom
+
+MAGIC = b'HTRC'
+VERSION = 1
+# magic, version, flags (unused), length of the snapshot that follows
+HEADER = struct.Struct('<4sHHI')
+# first cycle, number of cycles, pc, A, D at the start, payload bytes, writes
+CHUNK = struct.Struct('<QIHhhII')
+# first cycle, file offset of the chunk
+INDEX = struct.Struct('<QQ')
+# index offset, number of chunks, magic
+FOOTER = struct.Struct('<QI4s')
+INDEX_MAGIC = b'HTRX'
+
+CHUNK_CYCLES = 1 << 16
+
+DEST_M = emulator.DEST_M
+
+
+def put_varint(buf, value):
+    # 7 bits per byte, low groups first
+    while value > 127:
+        buf.append(value & 127 | 128)
+        value >>= 7
+    buf.append(value)
+
+
+def get_varint(data, pos):
+    # returns (value, position after it)
+    byte = data[pos]
+    if byte < 128:
+        return byte, pos + 1
+    value = byte & 127
+    shift = 7
+    while True:
+        pos += 1
+        byte = data[pos]
+        value |= (byte & 127) << shift
+        if byte < 128:
+            return value, pos + 1
+        shift += 7
+
+
+def zigzag(value):
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+
+def unzigzag(value):
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+class Recorder:
+    """
+    Runs an emulator and writes every cycle to a trace file
+    """
+
+    def __init__(self, machine, path, chunk_cycles=CHUNK_CYCLES):
+        """
+        :param machine: Emulator, its current state is the start of the trace
+        :param path: output file name
+        :param chunk_cycles: cycles per chunk
+        """
+        self.machine = machine
+        self.chunk_cycles = chunk_cycles
+        self.index = []
+        # ROM addresses whose instruction writes RAM
+        self.writers = [ins.__class__ is not int and bool(ins[2] & DEST_M) for ins in machine.code]
+        self.out = open(path, 'wb')
+        snapshot = machine.snapshot()
+        self.out.write(HEADER.pack(MAGIC, VERSION, 0, len(snapshot)))
+        self.out.write(snapshot)
+
+    def run(self, cycles):
+        """
+        Executes and records up to cycles instructions, in whole chunks
+        :param cycles: maximum number of instructions
+        :return: number of instructions executed
+        """
+        n = 0
+        while n < cycles and not self.machine.halted:
+            done = self.chunk(min(self.chunk_cycles, cycles - n))
+            if not done:
+                break
+            n += done
+        return n
+
+    def chunk(self, cycles):
+        # one chunk, encoded by a hook of the run loop of the emulator
+        machine = self.machine
+        writers = self.writers
+        ram = machine.ram
+        start = (machine.cycles, machine.pc, machine.a, machine.d)
+        buf = bytearray()
+        append = buf.append
+        expected = machine.pc
+        last = 0
+        writes = 0
+
+        def record(pc, a, next_pc):
+            nonlocal expected, last, writes
+            step = pc - expected
+            expected = pc + 1
+            if writers[pc]:
+                address = a & 32767
+                put_varint(buf, zigzag(step) << 1 | 1)
+                put_varint(buf, zigzag(address - last))
+                put_varint(buf, ram[address] & 0xFFFF)
+                last = address
+                writes += 1
+            elif step:
+                put_varint(buf, zigzag(step) << 1)
+            else:
+                append(0)
+
+        n = machine.execute(cycles, machine.halting, record)
+        if n:
+            self.index.append((start[0], self.out.tell()))
+            self.out.write(CHUNK.pack(start[0], n, start[1], start[2], start[3], len(buf), writes))
+            self.out.write(buf)
+        return n
+
+    def close(self):
+        """
+        Writes the chunk index and closes the file
+        :return:
+        """
+        offset = self.out.tell()
+        for entry in self.index:
+            self.out.write(INDEX.pack(*entry))
+        self.out.write(FOOTER.pack(offset, len(self.index), INDEX_MAGIC))
+        self.out.close()
+
+
+class TraceReader:
+    """
+    Memory-mapped trace, chunks are decoded one at a time
+    """
+
+    def __init__(self, path):
+        """
+        :param path: trace file name
+        """
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, length = HEADER.unpack_from(self.data)
+        if magic != MAGIC or version != VERSION:
+            raise Exception("Not a trace file: " + path)
+        self.snapshot = self.data[HEADER.size:HEADER.size + length]
+        offset, count, magic = FOOTER.unpack_from(self.data, len(self.data) - FOOTER.size)
+        if magic != INDEX_MAGIC:
+            raise Exception("Trace file was not closed: " + path)
+        self.starts = []
+        self.offsets = []
+        for i in range(count):
+            start, chunk_offset = INDEX.unpack_from(self.data, offset + i * INDEX.size)
+            self.starts.append(start)
+            self.offsets.append(chunk_offset)
+
+    def chunk(self, i):
+        """
+        :param i: chunk number
+        :return: (first cycle, cycles, pc, A, D, writes, payload as a memoryview)
+        """
+        offset = self.offsets[i]
+        start, cycles, pc, a, d, length, writes = CHUNK.unpack_from(self.data, offset)
+        payload = memoryview(self.data)[offset + CHUNK.size:offset + CHUNK.size + length]
+        return start, cycles, pc, a, d, writes, payload
+
+    def cycles(self):
+        """
+        :return: number of cycles in the trace, read from the chunk headers only
+        """
+        if not self.offsets:
+            return 0
+        start, cycles = self.chunk(len(self.offsets) - 1)[:2]
+        return start + cycles - self.starts[0]
+
+    def events(self, i):
+        """
+        Decodes one chunk
+        :param i: chunk number
+        :return: generator of (cycle, pc, address or None, value)
+        """
+        cycle, cycles, pc, _, _, _, payload = self.chunk(i)
+        pos = 0
+        expected = pc
+        last = 0
+        for cycle in range(cycle, cycle + cycles):
+            token, pos = get_varint(payload, pos)
+            pc = expected + unzigzag(token >> 1)
+            expected = pc + 1
+            if token & 1:
+                step, pos = get_varint(payload, pos)
+                value, pos = get_varint(payload, pos)
+                last += unzigzag(step)
+                yield cycle, pc, last, value - 65536 if value & 0x8000 else value
+            else:
+                yield cycle, pc, None, 0
+
+    def seek(self, cycle):
+        """
+        Events from a given cycle on, only the chunk holding it is decoded from its start
+        :param cycle: cycle number
+        :return: generator of (cycle, pc, address or None, value)
+        """
+        first = max(0, self.find(cycle))
+        for i in range(first, len(self.offsets)):
+            for event in self.events(i):
+                if event[0] >= cycle:
+                    yield event
+
+    def find(self, cycle):
+        # chunk holding the cycle, by binary search over the index
+        lo, hi = 0, len(self.starts)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.starts[mid] <= cycle:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo - 1
+
+    def ram_at(self, cycle):
+        """
+        RAM before the given cycle, from the snapshot and the writes up to it
+        :param cycle: cycle number
+        :return: array('h') of RAM_SIZE words
+        """
+        ram = array('h', self.snapshot[emulator.CHECKPOINT.size:])
+        if sys.byteorder == 'big':
+            ram.byteswap()
+        for i in range(len(self.offsets)):
+            if self.starts[i] >= cycle:
+                break
+            for event in self.events(i):
+                if event[0] >= cycle:
+                    return ram
+                if event[2] is not None:
+                    ram[event[2]] = event[3]
+        return ram
+
+    def stats(self, top=10):
+        """
+        Totals over the whole trace, decoded a chunk at a time
+        :param top: number of hottest addresses to keep
+        :return: dict of cycles, writes, jumps taken, distinct PCs, hottest PCs and write addresses
+        """
+        pcs = Counter()
+        written = Counter()
+        jumps = 0
+        # the first event starts the trace, it is not a jump
+        expected = self.chunk(0)[2] if self.offsets else 0
+        for i in range(len(self.offsets)):
+            for cycle, pc, address, value in self.events(i):
+                pcs[pc] += 1
+                if pc != expected:
+                    jumps += 1
+                expected = pc + 1
+                if address is not None:
+                    written[address] += 1
+        return {'cycles': self.cycles(), 'writes': sum(written.values()), 'jumps': jumps, 'pcs': len(pcs),
+                'hot pcs': pcs.most_common(top), 'hot writes': written.most_common(top)}
+
+
+if __name__ == '__main__':
+    command = sys.argv[1]
+    if command == 'record':
+        recorder = Recorder(emulator.Emulator(rom.load_rom(sys.argv[2])), sys.argv[3])
+        recorded = recorder.run(int(sys.argv[4]) if len(sys.argv) > 4 else 10 ** 6)
+        recorder.close()
+        print('recorded {n} cycles'.format(n=recorded))
+    elif command == 'stats':
+        for name, value in TraceReader(sys.argv[2]).stats().items():
+            print('{n:<12}{v}'.format(n=name, v=value))
+    elif command == 'seek':
+        reader = TraceReader(sys.argv[2])
+        for count, (cycle, pc, address, value) in enumerate(reader.seek(int(sys.argv[3]))):
+            if count == 20:
+                break
+            write = '' if address is None else '  RAM[{a}] = {v}'.format(a=address, v=value)
+            print('{c:>10}  pc {p}{w}'.format(c=cycle, p=pc, w=write))
@@ -1,5 +1,20 @@
+import os
 import sys
 
+import vmb
+
+# shared routines, named like functions so profiles show them on their own
+CALL_LABEL = 'vm.call'
+RETURN_LABEL = 'vm.return'
+HALT_LABEL = 'vm.halt'
+
+ROM_LIMIT = 32768
+
+# comparisons translated to a call of one shared routine per operator, or inline, or shared only
+# when the inline program would not fit in ROM
+COMPARISON_MODES = ('inline', 'shared', 'auto')
+COMPARISON_JUMPS = {'eq': 'JEQ', 'gt': 'JGT', 'lt': 'JLT'}
+
 def is_number(s):
     try:
         float(s)
@@ -14,24 +29,51 @@ def is_number(s):
         pass
         return False
 
-input = sys.argv[1]
-filename = input.split('.')
-output_file = '.'.join(filename[:-1]) + '.asm'
+def read_commands(path):
+    """
+    Reads the VM commands of a file, blank lines and comment lines are dropped
+    :param path: .vm or .vmb file name
+    :return: list of command lines, or the decoded command tuples of a .vmb file
+    """
+    if path.endswith(vmb.VMB_FILE):
+        return vmb.read_vmb(path)
+    with open(path, 'r', encoding='ascii') as f:
+        lines = [line for line in f.readlines() if line.strip()]
+    # remove space on the left
+    new_lines = []
+
+    #remove commentss
+    for line in lines:
+        if line[0:2] == '//':
+            continue
+        else:
+            new_lines.append(line.split('\n')[0])
+    return new_lines
 
-f = open(input, 'r', encoding='ascii')  
-lines = [line for line in f.readlines() if line.strip()]  
-# remove space on the left
-new_lines = []
 
-#remove commentss
-for line in lines:
-    if line[0:2] == '//':
-        continue
-    else:
-        new_lines.append(line.split('\n')[0])
+def static_name(path):
+    # statics are named after the file name without the extension
+    return '.'.join(os.path.basename(path).split('.')[:-1])
+
+
+def vm_files(path):
+    """
+    :param path: .vm or .vmb file, or a directory of them
+    :return: file names, Sys first, a class with both files is read from its .vmb
+    """
+    if not os.path.isdir(path):
+        return [path]
+    sources = {}
+    for name in sorted(os.listdir(path)):
+        base, ext = os.path.splitext(name)
+        if ext == vmb.VMB_FILE or ext == '.vm' and base not in sources:
+            sources[base] = os.path.join(path, name)
+    paths = [sources.pop('Sys')] if 'Sys' in sources else []
+    return paths + sorted(sources.values())
+
 
 # push 
-def push_write(type, val):
+def push_write(type, val, name):
     code = ""
     structure_0 = "@SP\n" + "A=M\n" + "M=D\n" + "@SP\n" + "M=M+1\n"
     structure_1 = "A=D+A\n" + "D=M\n" + structure_0
@@ -59,12 +101,12 @@ def push_write(type, val):
         code = "@R5\n" + "D=A\n" + "@" + val + "\n" + structure_1
 
     elif type == "static":
-        code = "@" + '.'.join(filename[:-1]) + "." + val + "\n" + "D=M\n" + structure_0
+        code = "@" + name + "." + val + "\n" + "D=M\n" + structure_0
 
     return code
 
 # pop 
-def pop_write(type, val):
+def pop_write(type, val, name):
     code = ""
     structure_2 = "D=D+A\n" + "@R13\n" + "M=D\n" + "@SP\n" + "AM=M-1\n" + "D=M\n" + "@R13\n" + "A=M\n" + "M=D\n"
 
@@ -90,12 +132,12 @@ def pop_write(type, val):
         code = "@R5\n" + "D=A\n" + "@" + val + "\n" + structure_2
 
     elif type == "static":
-        code = "@SP\n" + "AM=M-1\n" + "D=M\n" + "@" + '.'.join(filename[:-1]) + '.' + val + "\n" + "M=D\n"
+        code = "@SP\n" + "AM=M-1\n" + "D=M\n" + "@" + name + '.' + val + "\n" + "M=D\n"
 
     return code
 
 
-def asm_write(line, eq, gt, lt):
+def asm_write(line, eq, gt, lt, name):
     code = ""
     input = line.split(' ')
 
@@ -141,23 +183,491 @@ def asm_write(line, eq, gt, lt):
         c_3 = input[2]
 
         if c_1 == "push":
-            code = push_write(c_2, c_3)
+            code = push_write(c_2, c_3, name)
         else:
-            code = pop_write(c_2, c_3)
+            code = pop_write(c_2, c_3, name)
 
     return code, eq, gt, lt
 
-# translate
-n_1 = 0
-n_2 = 0
-n_3 = 0
-output = ''
-for line in new_lines:
-    output += asm_write(line, n_1, n_2, n_3)[0]
-    n_1 = asm_write(line, n_1, n_2, n_3)[1]
-    n_2 = asm_write(line, n_1, n_2, n_3)[2]
-    n_3 = asm_write(line, n_1, n_2, n_3)[3]
-
-# generate asm file
-out_file = open(output_file, 'w')
-out_file.write(output)
\ No newline at end of file
+def call_write(function, args, label):
+    # the call site passes nArgs in R13, the function in R14 and the return address in D
+    if int(args) < 2:
+        code = "@R13\n" + "M=" + str(args) + "\n"
+    else:
+        code = "@" + str(args) + "\n" + "D=A\n" + "@R13\n" + "M=D\n"
+    return code + "@" + function + "\n" + "D=A\n" + "@R14\n" + "M=D\n" + "@" + label + "\n" + "D=A\n" + "@" + CALL_LABEL + "\n" + "0;JMP\n" + "(" + label + ")\n"
+
+
+def flow_write(words, function, calls):
+    """
+    Translates label, goto, if-goto, function, call and return
+    :param words: the command split into words
+    :param function: function the command is in, labels are scoped to it
+    :param calls: number of calls translated so far, numbers the return labels
+    :return: asm code
+    """
+    command = words[0]
+    if command == 'label':
+        return "(" + function + "$" + words[1] + ")\n"
+    if command == 'goto':
+        return "@" + function + "$" + words[1] + "\n" + "0;JMP\n"
+    if command == 'if-goto':
+        return "@SP\n" + "AM=M-1\n" + "D=M\n" + "@" + function + "$" + words[1] + "\n" + "D;JNE\n"
+    if command == 'function':
+        code = "(" + words[1] + ")\n"
+        n = int(words[2])
+        if n:
+            # zero the locals with A walking up the stack, then store SP once
+            code += "@SP\n" + "A=M\n" + "M=0\n" + ("A=A+1\n" + "M=0\n") * (n - 1) + "D=A+1\n" + "@SP\n" + "M=D\n"
+        return code
+    if command == 'call':
+        return call_write(words[1], words[2], function + "$ret." + str(calls))
+    return "@" + RETURN_LABEL + "\n" + "0;JMP\n"
+
+
+FLOW = ('label', 'goto', 'if-goto', 'function', 'call', 'return')
+
+
+def compare_write(command, label):
+    # the return address goes in D, the routine leaves -1 or 0 on the stack
+    return "@" + label + "\n" + "D=A\n" + "@vm." + command + "\n" + "0;JMP\n" + "(" + label + ")\n"
+
+
+def compare_routine(command):
+    # the result starts as true and is cleared when the jump is not taken
+    routine = "vm." + command
+    return ("(" + routine + ")\n" + "@R15\n" + "M=D\n" +
+            "@SP\n" + "AM=M-1\n" + "D=M\n" + "A=A-1\n" + "D=M-D\n" + "M=-1\n" +
+            "@" + routine + "$true\n" + "D;" + COMPARISON_JUMPS[command] + "\n" +
+            "@SP\n" + "A=M-1\n" + "M=0\n" + "(" + routine + "$true)\n" +
+            "@R15\n" + "A=M\n" + "0;JMP\n")
+
+
+def call_routine():
+    # push the return address and the caller's frame, then ARG = SP - nArgs - 5, LCL = SP
+    push = "@SP\n" + "AM=M+1\n" + "M=D\n"
+    return ("(" + CALL_LABEL + ")\n" + "@SP\n" + "A=M\n" + "M=D\n" +
+            "@LCL\n" + "D=M\n" + push + "@ARG\n" + "D=M\n" + push +
+            "@THIS\n" + "D=M\n" + push + "@THAT\n" + "D=M\n" + push +
+            "@SP\n" + "MD=M+1\n" + "@LCL\n" + "M=D\n" +
+            "@R13\n" + "D=D-M\n" + "@5\n" + "D=D-A\n" + "@ARG\n" + "M=D\n" +
+            "@R14\n" + "A=M\n" + "0;JMP\n")
+
+
+def return_routine():
+    # frame = LCL in R14, return address in R15, *ARG = pop(), SP = ARG + 1, restore the caller
+    restore = "@R14\n" + "AM=M-1\n" + "D=M\n"
+    return ("(" + RETURN_LABEL + ")\n" + "@LCL\n" + "D=M\n" + "@R14\n" + "M=D\n" +
+            "@5\n" + "A=D-A\n" + "D=M\n" + "@R15\n" + "M=D\n" +
+            "@SP\n" + "AM=M-1\n" + "D=M\n" + "@ARG\n" + "A=M\n" + "M=D\n" +
+            "@ARG\n" + "D=M+1\n" + "@SP\n" + "M=D\n" +
+            restore + "@THAT\n" + "M=D\n" + restore + "@THIS\n" + "M=D\n" +
+            restore + "@ARG\n" + "M=D\n" + restore + "@LCL\n" + "M=D\n" +
+            "@R15\n" + "A=M\n" + "0;JMP\n")
+
+
+def bootstrap():
+    # SP = 256, call Sys.init, stop if it ever returns
+    return [('bootstrap', "@256\n" + "D=A\n" + "@SP\n" + "M=D\n" + call_write('Sys.init', 0, 'vm.boot$ret') +
+             "@" + HALT_LABEL + "\n" + "0;JMP\n")]
+
+
+def runtime(translated, shared=()):
+    """
+    The shared routines the translated commands need, behind a halt loop so that running off the
+    end of the program stops there
+    :param translated: list of (command, asm code)
+    :param shared: comparisons translated as calls
+    :return: list of (routine, asm code), empty when no routine is needed
+    """
+    used = set(command.split()[0] for command, _ in translated if command.split())
+    routines = []
+    # the bootstrap calls Sys.init and ends in the halt loop
+    if 'call' in used or 'return' in used or 'bootstrap' in used:
+        routines += [(CALL_LABEL, call_routine()), (RETURN_LABEL, return_routine())]
+    for command in sorted(COMPARISON_JUMPS):
+        if command in shared and command in used:
+            routines.append(('vm.' + command, compare_routine(command)))
+    if not routines:
+        return []
+    return [(HALT_LABEL, "(" + HALT_LABEL + ")\n" + "@" + HALT_LABEL + "\n" + "0;JMP\n")] + routines
+
+
+def rom_size(translated):
+    # labels do not take a ROM slot
+    return sum(1 for _, code in translated for line in code.split('\n') if line and line[0] != '(')
+
+
+def split_command(line, texts):
+    """
+    Words and text of one command, a .vmb command tuple is already split
+    :param line: .vm line, or command tuple from vmb.read_vmb
+    :param texts: command tuple -> text, filled as the tuples are met, equal commands are one tuple
+    :return: (words, text), words is empty for a blank or comment line
+    """
+    if line.__class__ is tuple:
+        text = texts.get(line)
+        if text is None:
+            text = texts[line] = ' '.join(str(word) for word in line)
+        return line, text
+    return line.split('//')[0].split(), line
+
+
+def translate_commands(commands, name, counters=None, shared=()):
+    """
+    Translates VM commands one by one
+    :param commands: VM command lines, or command tuples of a .vmb file
+    :param name: prefix of the static variables
+    :param counters: [eq, gt, lt, call] label numbers to continue from, updated in place, so
+    files translated into one program do not reuse labels
+    :param shared: comparisons translated as calls of the shared routines
+    :return: list of (command, asm code)
+    """
+    if counters is None:
+        counters = [0, 0, 0, 0]
+    n_1, n_2, n_3, calls = counters
+    function = name
+    output = []
+    texts = {}
+    for line in commands:
+        words, text = split_command(line, texts)
+        if not words:
+            continue
+        if words[0] in FLOW:
+            if words[0] == 'function':
+                function = words[1]
+            code = flow_write(words, function, calls)
+            if words[0] == 'call':
+                calls = calls + 1
+        elif words[0] in shared:
+            code = compare_write(words[0], function + "$" + words[0] + "." + str(calls))
+            calls = calls + 1
+        elif words[0] == 'push':
+            code = push_write(words[1], str(words[2]), name)
+        elif words[0] == 'pop':
+            code = pop_write(words[1], str(words[2]), name)
+        else:
+            code, n_1, n_2, n_3 = asm_write(words[0], n_1, n_2, n_3, name)
+        output.append((text, code))
+    counters[:] = [n_1, n_2, n_3, calls]
+    return output
+
+
+SEGMENT_BASES = {'local': 'LCL', 'argument': 'ARG', 'this': 'THIS', 'that': 'THAT'}
+SEGMENT_ADDRESSES = {'pointer': 3, 'temp': 5}
+# a cached pop walks A up from the segment base this far, farther ones go through R13 and R14
+WALK_LIMIT = 10
+SPILL = "@SP\n" + "AM=M+1\n" + "A=A-1\n" + "M=D\n"
+POP_D = "@SP\n" + "AM=M-1\n" + "D=M\n"
+
+
+def signed(value):
+    # wrap to a 16 bit word like the ALU does
+    return (value + 32768) % 65536 - 32768
+
+
+def load_a(value):
+    # A = value, a negative one from the complement since @ only takes 0..32767
+    if value >= 0:
+        return "@" + str(value) + "\n"
+    return "@" + str(~value) + "\n" + "A=!A\n"
+
+
+def load_d(value):
+    if value in (-1, 0, 1):
+        return "D=" + str(value) + "\n"
+    if -32768 < value < 0:
+        return "@" + str(-value) + "\n" + "D=-A\n"
+    return load_a(value) + "D=A\n"
+
+
+class CachedTranslator:
+    """
+    Translates VM commands keeping the top of the stack in D across commands, so that a value is
+    only stored on the stack in RAM when something else needs D. A pushed constant waits above D
+    and is folded into the next add, sub, and, or, neg, not, comparison or pop.
+    Labels, goto, function, call and return store D back; control only meets at labels, so the
+    stack is always whole in RAM there.
+    """
+
+    def __init__(self, name, counters=None, shared=()):
+        """
+        :param name: prefix of the static variables
+        :param counters: [eq, gt, lt, call] label numbers, as for translate_commands
+        :param shared: comparisons translated as calls of the shared routines
+        """
+        self.name = name
+        self.counters = counters if counters is not None else [0, 0, 0, 0]
+        self.shared = shared
+        self.function = name
+        # D holds a stack element that is not in RAM, the stack in RAM is one element short
+        self.cached = False
+        # the top of the stack when it is a constant not loaded yet, D then holds the one under it
+        self.constant = None
+
+    def to_d(self):
+        # load a waiting constant into D, storing the element under it first
+        if self.constant is None:
+            return ""
+        code = SPILL + load_d(self.constant)
+        self.constant = None
+        return code
+
+    def flush(self):
+        # the whole stack to RAM
+        code = self.to_d()
+        if self.cached:
+            code += SPILL
+            self.cached = False
+        return code
+
+    def load(self):
+        # the top of the stack to D, the rest to RAM
+        code = self.to_d()
+        if not self.cached:
+            code += POP_D
+            self.cached = True
+        return code
+
+    def address(self, segment, index):
+        # code that sets A to the address without using D, None when that takes D
+        if segment in SEGMENT_ADDRESSES:
+            return "@R" + str(SEGMENT_ADDRESSES[segment] + index) + "\n"
+        if segment == 'static':
+            return "@" + self.name + "." + str(index) + "\n"
+        if index > WALK_LIMIT:
+            return None
+        if index == 0:
+            return "@" + SEGMENT_BASES[segment] + "\n" + "A=M\n"
+        return "@" + SEGMENT_BASES[segment] + "\n" + "A=M+1\n" + "A=A+1\n" * (index - 1)
+
+    def push(self, segment, index):
+        if segment == 'constant':
+            value = signed(index)
+            if self.cached:
+                code = self.to_d()
+                self.constant = value
+                return code
+            self.cached = True
+            return load_d(value)
+        code = self.flush()
+        self.cached = True
+        if segment in SEGMENT_BASES and index > 1:
+            return code + "@" + str(index) + "\n" + "D=A\n" + "@" + SEGMENT_BASES[segment] + "\n" + "A=D+M\n" + "D=M\n"
+        return code + self.address(segment, index) + "D=M\n"
+
+    def pop(self, segment, index):
+        if segment == 'constant':
+            # drops the top
+            if self.constant is not None:
+                self.constant = None
+                return ""
+            if self.cached:
+                self.cached = False
+                return ""
+            return "@SP\n" + "M=M-1\n"
+        address = self.address(segment, index)
+        if self.constant in (-1, 0, 1) and address is not None:
+            # stored without D, which keeps the element under it
+            code = address + "M=" + str(self.constant) + "\n"
+            self.constant = None
+            return code
+        code = self.load()
+        self.cached = False
+        if address is not None:
+            return code + address + "M=D\n"
+        return (code + "@R13\n" + "M=D\n" + "@" + SEGMENT_BASES[segment] + "\n" + "D=M\n" + "@" + str(index) + "\n" +
+                "D=D+A\n" + "@R14\n" + "M=D\n" + "@R13\n" + "D=M\n" + "@R14\n" + "A=M\n" + "M=D\n")
+
+    def fold(self, command):
+        # applies command to D and the waiting constant
+        value = self.constant
+        self.constant = None
+        if command == 'add' and value in (-1, 0, 1):
+            return {-1: "D=D-1\n", 0: "", 1: "D=D+1\n"}[value]
+        if command == 'sub' and value in (-1, 0, 1):
+            return {-1: "D=D+1\n", 0: "", 1: "D=D-1\n"}[value]
+        if command == 'and' and value in (-1, 0):
+            return "" if value else "D=0\n"
+        if command == 'or' and value in (-1, 0):
+            return "D=-1\n" if value else ""
+        return load_a(value) + {'add': "D=D+A\n", 'sub': "D=D-A\n", 'and': "D=D&A\n", 'or': "D=D|A\n"}[command]
+
+    def binary(self, command):
+        # x - y for the comparisons
+        if self.constant is not None:
+            return self.fold('sub' if command in COMPARISON_JUMPS else command)
+        code = self.load() + "@SP\n" + "AM=M-1\n"
+        return code + {'add': "D=D+M\n", 'and': "D=D&M\n", 'or': "D=D|M\n"}.get(command, "D=M-D\n")
+
+    def arithmetic(self, command):
+        if command in ('neg', 'not'):
+            if self.constant is not None:
+                self.constant = signed(-self.constant) if command == 'neg' else ~self.constant
+                return ""
+            operation = "-" if command == 'neg' else "!"
+            if self.cached:
+                return "D=" + operation + "D\n"
+            self.cached = True
+            return "@SP\n" + "AM=M-1\n" + "D=" + operation + "M\n"
+        if command in self.shared:
+            calls = self.counters[3]
+            self.counters[3] = calls + 1
+            return self.flush() + compare_write(command, self.function + "$" + command + "." + str(calls))
+        code = self.binary(command)
+        if command in COMPARISON_JUMPS:
+            # D = -1 when x - y passes the jump, 0 otherwise
+            i = sorted(COMPARISON_JUMPS).index(command)
+            n = self.counters[i]
+            self.counters[i] = n + 1
+            true = command.upper() + "TRUE" + str(n)
+            end = command.upper() + "END" + str(n)
+            code += ("@" + true + "\n" + "D;" + COMPARISON_JUMPS[command] + "\n" + "D=0\n" + "@" + end + "\n" + "0;JMP\n" +
+                     "(" + true + ")\n" + "D=-1\n" + "(" + end + ")\n")
+        return code
+
+    def flow(self, words):
+        if words[0] == 'if-goto':
+            code = self.load()
+            self.cached = False
+            return code + "@" + self.function + "$" + words[1] + "\n" + "D;JNE\n"
+        code = self.flush()
+        if words[0] == 'function':
+            self.function = words[1]
+        code += flow_write(words, self.function, self.counters[3])
+        if words[0] == 'call':
+            self.counters[3] += 1
+        return code
+
+    def translate(self, commands):
+        """
+        :param commands: VM command lines, or command tuples of a .vmb file
+        :return: list of (command, asm code), the stack is whole in RAM after the last one
+        """
+        output = []
+        texts = {}
+        for line in commands:
+            words, text = split_command(line, texts)
+            if not words:
+                continue
+            if words[0] in FLOW:
+                code = self.flow(words)
+            elif words[0] == 'push':
+                code = self.push(words[1], int(words[2]))
+            elif words[0] == 'pop':
+                code = self.pop(words[1], int(words[2]))
+            else:
+                code = self.arithmetic(words[0])
+            output.append((text, code))
+        if output:
+            line, code = output[-1]
+            output[-1] = (line, code + self.flush())
+        return output
+
+
+def shared_comparisons(translated, limit=ROM_LIMIT):
+    """
+    The size/speed policy of the auto mode: inline comparisons are faster, so operators are only
+    shared, those with the most sites first, until the program fits in limit words
+    :param translated: inline translation
+    :param limit: ROM words available
+    :return: set of comparisons to share
+    """
+    size = rom_size(translated)
+    # comparison -> [sites, inline words]
+    sites = {}
+    for command, code in translated:
+        words = command.split()
+        if words and words[0] in COMPARISON_JUMPS:
+            entry = sites.setdefault(words[0], [0, 0])
+            entry[0] += 1
+            entry[1] += rom_size([(command, code)])
+    shared = set()
+    for command in sorted(sites, key=lambda command: -sites[command][0]):
+        if size <= limit:
+            break
+        # every site shrinks to a 4 word call, the routine is added once
+        count, words = sites[command]
+        saved = words - 4 * count - rom_size([('', compare_routine(command))])
+        if saved > 0:
+            size -= saved
+            shared.add(command)
+    return shared
+
+
+def translate_program(files, shared=(), cache=False):
+    """
+    Translates the commands of several files into one program, with the bootstrap when one of them
+    defines Sys.init
+    :param files: list of (command lines or tuples, static name)
+    :param shared: comparisons translated as calls of the shared routines
+    :param cache: keep the top of the stack in D with CachedTranslator
+    :return: list of (command, asm code), the shared routines at the end
+    """
+    counters = [0, 0, 0, 0]
+    output = []
+    for lines, name in files:
+        if cache:
+            output += CachedTranslator(name, counters, shared).translate(lines)
+        else:
+            output += translate_commands(lines, name, counters, shared)
+    if any(command.split()[:2] == ['function', 'Sys.init'] for command, _ in output):
+        output = bootstrap() + output
+    return output + runtime(output, shared)
+
+
+def translate_files(paths, comparisons='inline', limit=ROM_LIMIT, cache=False):
+    """
+    Translates VM files into one program
+    :param paths: .vm or .vmb file names
+    :param comparisons: one of COMPARISON_MODES
+    :param limit: ROM words the auto mode fits the program in
+    :param cache: keep the top of the stack in D across commands
+    :return: list of (command, asm code), the shared routines at the end
+    """
+    if comparisons not in COMPARISON_MODES:
+        raise Exception("Unknown comparison mode " + comparisons)
+    files = [(read_commands(path), static_name(path)) for path in paths]
+    if comparisons == 'shared':
+        return translate_program(files, set(COMPARISON_JUMPS), cache)
+    output = translate_program(files, cache=cache)
+    if comparisons == 'auto':
+        shared = shared_comparisons(output, limit)
+        if shared:
+            output = translate_program(files, shared, cache)
+    return output
+
+
+def translate(path, output_file=None, comparisons='inline', cache=False):
+    """
+    Translates a .vm file, or the .vm files of a directory, into one .asm file
+    :param path: .vm or .vmb file name, or directory
+    :param output_file: .asm file name, defaults to the one next to the source or inside the directory
+    :param comparisons: one of COMPARISON_MODES
+    :param cache: keep the top of the stack in D across commands
+    :return: output file name
+    """
+    if output_file is None:
+        if os.path.isdir(path):
+            output_file = os.path.join(path, os.path.basename(os.path.normpath(path)) + '.asm')
+        else:
+            output_file = os.path.splitext(path)[0] + '.asm'
+    output = ''.join(code for _, code in translate_files(vm_files(path), comparisons, cache=cache))
+    # generate asm file
+    with open(output_file, 'w') as out_file:
+        out_file.write(output)
+    return output_file
+
+
+if __name__ == '__main__':
+    # -compare inline|shared|auto picks how eq, gt and lt are translated, -cache keeps the top of the stack in D
+    args = sys.argv[1:]
+    cache = '-cache' in args
+    if cache:
+        args.remove('-cache')
+    comparisons = 'inline'
+    if '-compare' in args:
+        i = args.index('-compare')
+        comparisons = args[i + 1]
+        del args[i:i + 2]
+    translate(args[0], comparisons=comparisons, cache=cache)
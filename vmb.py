@@ -0,0 +1,219 @@
+"""
+Binary VM code (.vmb). Programs repeat a small set of distinct commands, so the file holds the
+table of distinct commands once, each as an opcode byte with varint operands, and the program as an
+array of indices into that table. Loading is an array.frombytes and a table lookup per command,
+no text is parsed. Push and pop carry the segment id in the low bits of the opcode.
+
+header:   b'HVMB', version byte
+strings:  varint count, then varint length and ASCII bytes of each name
+commands: varint count, then each distinct command as an opcode byte and
+          push / pop          varint index
+          label / goto / if   varint string
+          function / call     varint string, varint locals or arguments
+program:  index width byte (1 or 2), then one little endian index per command to the end
+
+python vmb.py file.vm|directory
+writes a .vmb next to every .vm file
+"""
+import os
+import sys
+from array import array
+
+VMB_FILE = '.vmb'
+VMB_MAGIC = b'HVMB'
+VMB_VERSION = 1
+
+PUSH = 0
+POP = 16
+SEGMENTS = ['constant', 'local', 'argument', 'this', 'that', 'pointer', 'temp', 'static']
+ARITHMETIC = {'add': 32, 'sub': 33, 'neg': 34, 'eq': 35, 'gt': 36, 'lt': 37, 'and': 38, 'or': 39, 'not': 40}
+LABEL, GOTO, IF_GOTO, FUNCTION, CALL, RETURN = range(48, 54)
+
+# opcode -> command, or (command, segment) for push and pop
+NAMES = {LABEL: 'label', GOTO: 'goto', IF_GOTO: 'if-goto', FUNCTION: 'function', CALL: 'call', RETURN: 'return'}
+for _name, _op in ARITHMETIC.items():
+    NAMES[_op] = _name
+for _id, _name in enumerate(SEGMENTS):
+    NAMES[PUSH + _id] = ('push', _name)
+    NAMES[POP + _id] = ('pop', _name)
+SEGMENT_IDS = {name: i for i, name in enumerate(SEGMENTS)}
+
+
+def varint(value, out):
+    # 7 bits per byte, high bit set on all but the last
+    while value > 127:
+        out.append(value & 127 | 128)
+        value >>= 7
+    out.append(value)
+
+
+class VMBWriter:
+    """
+    Drop-in replacement for the VMWriter of the compiler
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.strings = {}
+        # encoded command -> index in the command table
+        self.commands = {}
+        self.program = []
+
+    def string(self, text):
+        index = self.strings.get(text)
+        if index is None:
+            index = self.strings[text] = len(self.strings)
+        return index
+
+    def add(self, op, *operands):
+        encoded = bytearray([op])
+        for operand in operands:
+            varint(operand, encoded)
+        encoded = bytes(encoded)
+        index = self.commands.get(encoded)
+        if index is None:
+            index = self.commands[encoded] = len(self.commands)
+        self.program.append(index)
+
+    def write_push(self, segment, index):
+        self.add(PUSH + SEGMENT_IDS[segment], int(index))
+
+    def write_pop(self, segment, index):
+        self.add(POP + SEGMENT_IDS[segment], int(index))
+
+    def write_call(self, name, nArgs):
+        self.add(CALL, self.string(name), int(nArgs))
+
+    def write_function(self, name, nlocals):
+        self.add(FUNCTION, self.string(name), int(nlocals))
+
+    def write_arithmetic(self, command):
+        self.add(ARITHMETIC[command])
+
+    def write_label(self, label):
+        self.add(LABEL, self.string(label))
+
+    def write_goto(self, label):
+        self.add(GOTO, self.string(label))
+
+    def write_if(self, label):
+        self.add(IF_GOTO, self.string(label))
+
+    def write_return(self):
+        self.add(RETURN)
+
+    def write_command(self, words):
+        """
+        Writes a command given as the words of a .vm line
+        :param words: e.g. ['push', 'local', '2']
+        :return:
+        """
+        command = words[0]
+        if command in ('push', 'pop'):
+            (self.write_push if command == 'push' else self.write_pop)(words[1], words[2])
+        elif command in ('call', 'function'):
+            (self.write_call if command == 'call' else self.write_function)(words[1], words[2])
+        elif command in ('label', 'goto', 'if-goto'):
+            {'label': self.write_label, 'goto': self.write_goto, 'if-goto': self.write_if}[command](words[1])
+        elif command == 'return':
+            self.write_return()
+        else:
+            self.write_arithmetic(command)
+
+    def close(self):
+        out = bytearray(VMB_MAGIC)
+        out.append(VMB_VERSION)
+        varint(len(self.strings), out)
+        for text in self.strings:
+            data = text.encode('ascii')
+            varint(len(data), out)
+            out += data
+        varint(len(self.commands), out)
+        for encoded in self.commands:
+            out += encoded
+        program = array('B' if len(self.commands) <= 256 else 'H', self.program)
+        if sys.byteorder == 'big':
+            program.byteswap()
+        out.append(program.itemsize)
+        with open(self.file_name, 'wb') as f:
+            f.write(out + program.tobytes())
+
+
+def read_vmb(path):
+    """
+    Commands of a .vmb file, in the form read_vm gives them, without parsing text
+    :param path: .vmb file name
+    :return: list of command tuples, e.g. ('push', 'local', 2) or ('call', 'Math.multiply', 2),
+    equal commands are the same tuple
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:4] != VMB_MAGIC or data[4] != VMB_VERSION:
+        raise Exception("Not a version {v} .vmb file: {p}".format(v=VMB_VERSION, p=path))
+    position = 5
+
+    def number():
+        nonlocal position
+        value = shift = 0
+        while True:
+            byte = data[position]
+            position += 1
+            value |= (byte & 127) << shift
+            if byte < 128:
+                return value
+            shift += 7
+
+    strings = []
+    for _ in range(number()):
+        length = number()
+        strings.append(data[position:position + length].decode('ascii'))
+        position += length
+    table = []
+    for _ in range(number()):
+        op = data[position]
+        position += 1
+        name = NAMES.get(op)
+        if name is None:
+            raise Exception("Bad opcode {o} in {p}".format(o=op, p=path))
+        if name.__class__ is tuple:
+            table.append((name[0], name[1], number()))
+        elif op == CALL or op == FUNCTION:
+            table.append((name, strings[number()], number()))
+        elif op == LABEL or op == GOTO or op == IF_GOTO:
+            table.append((name, strings[number()]))
+        else:
+            table.append((name,))
+    program = array('B' if data[position] == 1 else 'H')
+    program.frombytes(data[position + 1:])
+    if sys.byteorder == 'big':
+        program.byteswap()
+    return list(map(table.__getitem__, program))
+
+
+def convert(path):
+    """
+    Writes the .vmb of a .vm file
+    :param path: .vm file name
+    :return: .vmb file name
+    """
+    output_file = path[:-len('.vm')] + VMB_FILE
+    writer = VMBWriter(output_file)
+    with open(path, 'r', encoding='ascii') as f:
+        for line in f:
+            words = line.split('//')[0].split()
+            if words:
+                writer.write_command(words)
+    writer.close()
+    return output_file
+
+
+if __name__ == '__main__':
+    path = sys.argv[1]
+    if os.path.isdir(path):
+        paths = sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith('.vm'))
+    else:
+        paths = [path]
+    for vm_path in paths:
+        vmb_path = convert(vm_path)
+        print('{v} {s} bytes -> {b} {n} bytes'.format(
+            v=vm_path, s=os.path.getsize(vm_path), b=vmb_path, n=os.path.getsize(vmb_path)))
@@ -0,0 +1,197 @@
+"""
+What each kind of VM command costs: Hack instructions per template from the translator, and
+cycles per command kind from an emulator run of the translated program.
+
+python vmcost.py filename.vm|directory [cycles] [-ram 0=256,1=300,...]
+-ram sets RAM words before the run, as the test scripts of the course do
+-compare reports the ROM words saved and cycles added by shared eq, gt and lt routines
+-cache translates with the top of the stack kept in D
+"""
+import sys
+
+import assembler
+import emulator
+import virtualMachine
+import vminterp
+
+
+def kind(command):
+    """
+    Groups commands by what their template depends on
+    :param command: VM command line
+    :return: "push local", "pop static", "eq", "call", ...
+    """
+    words = command.split()
+    if words[0] in ('push', 'pop'):
+        return words[0] + ' ' + words[1]
+    return words[0]
+
+
+def instruction_count(code):
+    # labels do not take a ROM slot
+    return sum(1 for line in code.split('\n') if line and line[0] != '(')
+
+
+class CostMap:
+    """
+    ROM address ranges of every translated command
+    """
+
+    def __init__(self, translated):
+        """
+        :param translated: list of (command, asm code) from the translator
+        """
+        self.commands = []
+        self.kinds = []
+        self.starts = []
+        self.sizes = []
+        address = 0
+        for command, code in translated:
+            size = instruction_count(code)
+            self.commands.append(command)
+            self.kinds.append(kind(command))
+            self.starts.append(address)
+            self.sizes.append(size)
+            address += size
+        self.source = ''.join(code for _, code in translated)
+        self.size = address
+
+    def command_at(self):
+        """
+        :return: list giving the command index of every ROM address
+        """
+        owner = []
+        for i, size in enumerate(self.sizes):
+            owner += [i] * size
+        return owner
+
+    def static(self):
+        """
+        :return: {kind: (commands, instructions)}
+        """
+        totals = {}
+        for name, size in zip(self.kinds, self.sizes):
+            count, words = totals.get(name, (0, 0))
+            totals[name] = (count + 1, words + size)
+        return totals
+
+    def executions(self, hits):
+        """
+        :param hits: executions per ROM address
+        :return: {kind: times the commands of that kind ran}
+        """
+        totals = {}
+        for name, start, size in zip(self.kinds, self.starts, self.sizes):
+            if size and hits[start]:
+                totals[name] = totals.get(name, 0) + hits[start]
+        return totals
+
+    def dynamic(self, hits):
+        """
+        Cycles per command kind
+        :param hits: executions per ROM address
+        :return: {kind: cycles}
+        """
+        totals = {}
+        for address, i in enumerate(self.command_at()):
+            if hits[address]:
+                totals[self.kinds[i]] = totals.get(self.kinds[i], 0) + hits[address]
+        return totals
+
+    def report(self, hits):
+        """
+        :param hits: executions per ROM address
+        :return: text report, the kinds that took the most cycles first
+        """
+        static = self.static()
+        dynamic = self.dynamic(hits)
+        total = sum(dynamic.values()) or 1
+        lines = ['{k:<18}{n:>8}{w:>8}{e:>8}{c:>12}{p:>8}'.format(
+            k='command', n='count', w='words', e='each', c='cycles', p='%')]
+        for name in sorted(static, key=lambda name: (-dynamic.get(name, 0), -static[name][1])):
+            count, words = static[name]
+            cycles = dynamic.get(name, 0)
+            lines.append('{k:<18}{n:>8}{w:>8}{e:>8.1f}{c:>12}{p:>7.2f}%'.format(
+                k=name, n=count, w=words, e=words / count, c=cycles, p=100.0 * cycles / total))
+        lines.append('{k:<18}{n:>8}{w:>8}{e:>8}{c:>12}'.format(
+            k='total', n=len(self.commands), w=self.size, e='', c=sum(dynamic.values())))
+        return '\n'.join(lines)
+
+
+def run(translated, cycles, ram):
+    """
+    :param translated: list of (command, asm code)
+    :param cycles: maximum number of instructions
+    :param ram: {address: value} set before the run
+    :return: CostMap, hits per ROM address, Emulator after the run
+    """
+    costs = CostMap(translated)
+    machine = emulator.Emulator(assembler.assemble(costs.source.split('\n')))
+    for address, value in ram.items():
+        machine.ram[address] = value
+    hits = [0] * emulator.ROM_SIZE
+    machine.run_profiled(cycles, hits)
+    return costs, hits, machine
+
+
+def comparison_report(paths, cycles, ram, cache=False):
+    """
+    ROM words saved against cycles added when eq, gt and lt call shared routines instead of
+    being inline. Cycles added are for the comparisons the inline run executed, as a share of
+    the cycles it took to halt.
+    :param paths: .vm or .vmb file names
+    :param cycles: maximum number of instructions of each run
+    :param ram: {address: value} set before the runs
+    :param cache: translate with the top of the stack kept in D
+    :return: text report
+    """
+    inline, inline_hits, inline_machine = run(virtualMachine.translate_files(paths, 'inline', cache=cache), cycles, ram)
+    shared, shared_hits, shared_machine = run(virtualMachine.translate_files(paths, 'shared', cache=cache), cycles, ram)
+    inline_words, shared_words = inline.static(), shared.static()
+    inline_cycles, shared_cycles = inline.dynamic(inline_hits), shared.dynamic(shared_hits)
+    inline_runs, shared_runs = inline.executions(inline_hits), shared.executions(shared_hits)
+    lines = ['{k:<6}{s:>8}{i:>8}{h:>8}{v:>8}{e:>12}{a:>8}{b:>8}{c:>12}'.format(
+        k='', s='sites', i='inline', h='shared', v='saved', e='executed', a='each', b='shared', c='added')]
+    total = 0
+    for name in sorted(virtualMachine.COMPARISON_JUMPS):
+        if name not in inline_words:
+            continue
+        routine = 'vm.' + name
+        sites, words = inline_words[name]
+        words_shared = shared_words[name][1] + shared_words[routine][1]
+        executed = inline_runs.get(name, 0)
+        each = inline_cycles.get(name, 0) / max(executed, 1)
+        each_shared = ((shared_cycles.get(name, 0) + shared_cycles.get(routine, 0)) /
+                       max(shared_runs.get(name, 0), 1))
+        added = round(executed * (each_shared - each))
+        total += added
+        lines.append('{k:<6}{s:>8}{i:>8}{h:>8}{v:>8}{e:>12}{a:>8.1f}{b:>8.1f}{c:>12}'.format(
+            k=name, s=sites, i=words, h=words_shared, v=words - words_shared, e=executed, a=each,
+            b=each_shared, c=added))
+    lines.append('ROM {i} -> {s} words, {c} of {n} cycles added ({p:.2f}%){h}'.format(
+        i=inline.size, s=shared.size, c=total, n=inline_machine.cycles,
+        p=100.0 * total / max(inline_machine.cycles, 1),
+        h='' if inline_machine.halted and shared_machine.halted else ', the runs did not halt'))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    ram = {}
+    if '-ram' in args:
+        i = args.index('-ram')
+        ram = vminterp.parse_ram(args[i + 1])
+        del args[i:i + 2]
+    compare = '-compare' in args
+    if compare:
+        args.remove('-compare')
+    cache = '-cache' in args
+    if cache:
+        args.remove('-cache')
+    paths = virtualMachine.vm_files(args[0])
+    cycles = int(args[1]) if len(args) > 1 else 10 ** 6
+    if compare:
+        print(comparison_report(paths, cycles, ram, cache))
+    else:
+        costs, hits, _ = run(virtualMachine.translate_files(paths, cache=cache), cycles, ram)
+        print(costs.report(hits))
@@ -0,0 +1,455 @@
+"""
+Runs .vm files without translating them. The commands are parsed once into tuples of an integer
+opcode and resolved operands: segment and command are fused into the opcode, labels and
+functions are resolved to instruction indices, statics to RAM addresses.
+
+RAM follows the translator: SP, LCL, ARG, THIS, THAT in RAM[0..4], temp at 5, statics from 16 in
+order of first appearance, the stack from 256. Calls push the usual five word frame, the return
+instruction index is also kept on a Python call stack, which is what return uses.
+
+python vminterp.py file.vm|directory [steps] [-ram 0=256,1=300,...]
+"""
+import os
+import sys
+import time
+from array import array
+
+import emulator
+import virtualMachine
+import vmb
+
+SP = 0
+LCL = 1
+ARG = 2
+THIS = 3
+THAT = 4
+TEMP = 5
+STATIC_BASE = 16
+STACK_BASE = 256
+
+# push and pop opcodes are the segment opcode plus PUSH or POP
+PUSH = 0
+POP = 10
+CONSTANT, LOCAL, ARGUMENT, THIS_SEGMENT, THAT_SEGMENT, POINTER, TEMP_SEGMENT, STATIC = range(8)
+SEGMENTS = {'constant': CONSTANT, 'local': LOCAL, 'argument': ARGUMENT, 'this': THIS_SEGMENT,
+            'that': THAT_SEGMENT, 'pointer': POINTER, 'temp': TEMP_SEGMENT, 'static': STATIC}
+
+ADD, SUB, NEG, EQ, GT, LT, AND, OR, NOT = range(20, 29)
+ARITHMETIC = {'add': ADD, 'sub': SUB, 'neg': NEG, 'eq': EQ, 'gt': GT, 'lt': LT, 'and': AND, 'or': OR,
+              'not': NOT}
+
+GOTO, IF_GOTO, FUNCTION, CALL, RETURN, HALT, NATIVE = range(30, 37)
+OPCODES = 37
+
+# what Sys.init runs before Main.main
+BOOT = ['Memory.init', 'Math.init', 'Screen.init', 'Output.init', 'Keyboard.init']
+
+
+class Halt(Exception):
+    # raised by the halt handler or a native to leave the dispatch loop
+    pass
+
+
+def read_vm(path):
+    """
+    Commands of a .vm or .vmb file, or of every one in a directory, Sys first. A class with both
+    files is read from its .vmb.
+    :param path: file or directory name
+    :return: list of (file name without extension, list of command word lists)
+    """
+    files = []
+    for file_path in virtualMachine.vm_files(path):
+        base, ext = os.path.splitext(os.path.basename(file_path))
+        if ext == vmb.VMB_FILE:
+            files.append((base, vmb.read_vmb(file_path)))
+            continue
+        commands = []
+        with open(file_path, 'r', encoding='ascii') as f:
+            for line in f:
+                words = line.split('//')[0].split()
+                if words:
+                    commands.append(words)
+        files.append((base, commands))
+    return files
+
+
+def parse_ram(text):
+    # "0=256,1=300" -> {0: 256, 1: 300}
+    values = {}
+    for item in text.split(','):
+        address, value = item.split('=')
+        values[int(address)] = int(value)
+    return values
+
+
+class VMProgram:
+    """
+    Parsed and resolved VM code
+    """
+
+    def __init__(self, files):
+        """
+        :param files: list of (file name, command word lists) from read_vm
+        """
+        self.code = []
+        self.names = []
+        self.functions = {}
+        self.statics = {}
+        # instruction index -> name of the called function, calls are linked by the interpreter
+        self.callees = {}
+        labels = {}
+        unresolved = []
+        for file_name, commands in files:
+            function = file_name
+            # .vmb commands are shared tuples, the instruction of a push, pop or arithmetic
+            # command is built once per file
+            built = {}
+            for words in commands:
+                if words.__class__ is tuple:
+                    instruction = built.get(words)
+                    if instruction is not None:
+                        self.names.append(function)
+                        self.code.append(instruction)
+                        continue
+                command = words[0]
+                if command == 'label':
+                    labels[function + '$' + words[1]] = len(self.code)
+                    continue
+                self.names.append(function)
+                if command in ARITHMETIC:
+                    self.code.append((ARITHMETIC[command], 0, 0))
+                    if words.__class__ is tuple:
+                        built[words] = self.code[-1]
+                elif command in ('push', 'pop'):
+                    segment = SEGMENTS[words[1]]
+                    index = int(words[2])
+                    if segment == STATIC:
+                        index = self.static(file_name + '.' + str(index))
+                    elif segment == POINTER:
+                        index += THIS
+                    elif segment == TEMP_SEGMENT:
+                        index += TEMP
+                    elif segment == CONSTANT and command == 'pop':
+                        raise Exception("Cannot pop to constant in " + function)
+                    self.code.append(((PUSH if command == 'push' else POP) + segment, index, 0))
+                    if words.__class__ is tuple:
+                        built[words] = self.code[-1]
+                elif command in ('goto', 'if-goto'):
+                    unresolved.append((len(self.code), function + '$' + words[1]))
+                    self.code.append((GOTO if command == 'goto' else IF_GOTO, 0, 0))
+                elif command == 'function':
+                    function = words[1]
+                    self.functions[function] = len(self.code)
+                    self.names[-1] = function
+                    self.code.append((FUNCTION, int(words[2]), 0))
+                elif command == 'call':
+                    self.callees[len(self.code)] = words[1]
+                    self.code.append((CALL, 0, int(words[2])))
+                elif command == 'return':
+                    self.code.append((RETURN, 0, 0))
+                else:
+                    raise Exception("Unknown VM command: " + ' '.join(str(word) for word in words))
+        for index, label in unresolved:
+            op = self.code[index][0]
+            target = labels.get(label)
+            if target is None:
+                raise Exception("Jump to undefined label " + label)
+            if op == GOTO and target == index:
+                # label X, goto X is how programs stop
+                op = HALT
+            self.code[index] = (op, target, 0)
+
+    def static(self, name):
+        # statics are allocated in order of first appearance, as the assembler does
+        address = self.statics.get(name)
+        if address is None:
+            address = self.statics[name] = STATIC_BASE + len(self.statics)
+        return address
+
+
+class VMInterpreter:
+    """
+    Executes a VMProgram on a Hack RAM
+    """
+
+    def __init__(self, program, natives=None, ram=None):
+        """
+        Starts in Sys.init when the program has one. Without it, a program using natives starts
+        with the init functions of the OS classes it defines and then Main.main, any other program
+        at its first command.
+        :param program: VMProgram
+        :param natives: function name -> Python function taking the arguments and returning the
+        value, called instead of the VM function of that name
+        :param ram: RAM to run on, a new one by default
+        """
+        self.program = program
+        self.code = list(program.code)
+        self.natives = natives or {}
+        self.slots = []
+        self.ram = ram if ram is not None else array('h', bytes(2 * emulator.RAM_SIZE))
+        self.calls = []
+        self.steps = 0
+        self.halted = False
+        self.pc = 0
+        self.ram[SP] = STACK_BASE
+        for index, name in program.callees.items():
+            self.code[index] = self.link(name, self.code[index][2])
+        # running off the end of the program or returning from Sys.init halts
+        self.code.append((HALT, 0, 0))
+        functions = program.functions
+        if 'Sys.init' in functions:
+            self.push_frame(len(self.code) - 1, 0)
+            self.pc = functions['Sys.init']
+        elif self.natives and 'Main.main' in functions:
+            self.pc = len(self.code)
+            for name in BOOT + ['Main.main']:
+                if name in functions and name not in self.natives:
+                    self.code.append(self.link(name, 0))
+                    self.code.append((POP + TEMP_SEGMENT, TEMP, 0))
+            self.code.append((HALT, 0, 0))
+
+    def link(self, name, args):
+        """
+        :param name: called function
+        :param args: number of arguments
+        :return: the call instruction, a native call when there is a native of that name
+        """
+        if name in self.natives:
+            self.slots.append(self.natives[name])
+            return NATIVE, len(self.slots) - 1, args
+        if name not in self.program.functions:
+            raise Exception("Call to undefined function " + name)
+        return CALL, self.program.functions[name], args
+
+    def push_frame(self, ret, args):
+        """
+        Writes the frame of a call the way the translated code does
+        :param ret: instruction index to return to
+        :param args: number of arguments on the stack
+        :return:
+        """
+        ram = self.ram
+        sp = ram[SP]
+        ram[sp] = emulator.wrap(ret)
+        ram[sp + 1] = ram[LCL]
+        ram[sp + 2] = ram[ARG]
+        ram[sp + 3] = ram[THIS]
+        ram[sp + 4] = ram[THAT]
+        ram[ARG] = sp - args
+        ram[LCL] = ram[SP] = sp + 5
+        self.calls.append(ret)
+
+    def run(self, steps):
+        """
+        Executes VM commands until the program halts or the budget is used up. Every opcode has a
+        handler closed over the interpreter state, the loop only indexes the table and calls.
+        :param steps: maximum number of commands
+        :return: number of commands executed
+        """
+        code = self.code
+        ram = self.ram
+        calls = self.calls
+        slots = self.slots
+        pc = self.pc
+        sp, lcl, arg = ram[SP], ram[LCL], ram[ARG]
+
+        def push_constant(x, y):
+            nonlocal sp
+            ram[sp] = x
+            sp += 1
+
+        def push_local(x, y):
+            nonlocal sp
+            ram[sp] = ram[lcl + x]
+            sp += 1
+
+        def push_argument(x, y):
+            nonlocal sp
+            ram[sp] = ram[arg + x]
+            sp += 1
+
+        def push_this(x, y):
+            nonlocal sp
+            ram[sp] = ram[ram[THIS] + x]
+            sp += 1
+
+        def push_that(x, y):
+            nonlocal sp
+            ram[sp] = ram[ram[THAT] + x]
+            sp += 1
+
+        def push_address(x, y):
+            # pointer, temp and static were resolved to RAM addresses
+            nonlocal sp
+            ram[sp] = ram[x]
+            sp += 1
+
+        def pop_local(x, y):
+            nonlocal sp
+            sp -= 1
+            ram[lcl + x] = ram[sp]
+
+        def pop_argument(x, y):
+            nonlocal sp
+            sp -= 1
+            ram[arg + x] = ram[sp]
+
+        def pop_this(x, y):
+            nonlocal sp
+            sp -= 1
+            ram[ram[THIS] + x] = ram[sp]
+
+        def pop_that(x, y):
+            nonlocal sp
+            sp -= 1
+            ram[ram[THAT] + x] = ram[sp]
+
+        def pop_address(x, y):
+            nonlocal sp
+            sp -= 1
+            ram[x] = ram[sp]
+
+        def add(x, y):
+            nonlocal sp
+            sp -= 1
+            ram[sp - 1] = (ram[sp - 1] + ram[sp] + 32768 & 65535) - 32768
+
+        def sub(x, y):
+            nonlocal sp
+            sp -= 1
+            ram[sp - 1] = (ram[sp - 1] - ram[sp] + 32768 & 65535) - 32768
+
+        def neg(x, y):
+            ram[sp - 1] = (32768 - ram[sp - 1] & 65535) - 32768
+
+        def eq(x, y):
+            nonlocal sp
+            sp -= 1
+            ram[sp - 1] = -1 if ram[sp - 1] == ram[sp] else 0
+
+        def gt(x, y):
+            nonlocal sp
+            sp -= 1
+            ram[sp - 1] = -1 if ram[sp - 1] > ram[sp] else 0
+
+        def lt(x, y):
+            nonlocal sp
+            sp -= 1
+            ram[sp - 1] = -1 if ram[sp - 1] < ram[sp] else 0
+
+        def and_(x, y):
+            nonlocal sp
+            sp -= 1
+            ram[sp - 1] &= ram[sp]
+
+        def or_(x, y):
+            nonlocal sp
+            sp -= 1
+            ram[sp - 1] |= ram[sp]
+
+        def not_(x, y):
+            ram[sp - 1] = ~ram[sp - 1]
+
+        def goto(x, y):
+            nonlocal pc
+            pc = x
+
+        def if_goto(x, y):
+            nonlocal sp, pc
+            sp -= 1
+            if ram[sp]:
+                pc = x
+
+        def function(x, y):
+            nonlocal sp
+            for _ in range(x):
+                ram[sp] = 0
+                sp += 1
+
+        def call(x, y):
+            nonlocal sp, lcl, arg, pc
+            ram[sp] = (pc + 32768 & 65535) - 32768
+            ram[sp + 1] = lcl
+            ram[sp + 2] = arg
+            ram[sp + 3] = ram[THIS]
+            ram[sp + 4] = ram[THAT]
+            arg = sp - y
+            sp += 5
+            lcl = sp
+            calls.append(pc)
+            pc = x
+
+        def return_(x, y):
+            nonlocal sp, lcl, arg, pc
+            frame = lcl
+            ram[arg] = ram[sp - 1]
+            sp = arg + 1
+            ram[THAT] = ram[frame - 1]
+            ram[THIS] = ram[frame - 2]
+            arg = ram[frame - 3]
+            lcl = ram[frame - 4]
+            pc = calls.pop()
+
+        def native(x, y):
+            nonlocal sp
+            sp -= y
+            ram[sp] = (slots[x](*ram[sp:sp + y]) + 32768 & 65535) - 32768
+            sp += 1
+
+        def halt(x, y):
+            raise Halt()
+
+        table = [None] * OPCODES
+        table[PUSH + CONSTANT] = push_constant
+        table[PUSH + LOCAL] = push_local
+        table[PUSH + ARGUMENT] = push_argument
+        table[PUSH + THIS_SEGMENT] = push_this
+        table[PUSH + THAT_SEGMENT] = push_that
+        table[POP + LOCAL] = pop_local
+        table[POP + ARGUMENT] = pop_argument
+        table[POP + THIS_SEGMENT] = pop_this
+        table[POP + THAT_SEGMENT] = pop_that
+        for segment in (POINTER, TEMP_SEGMENT, STATIC):
+            table[PUSH + segment] = push_address
+            table[POP + segment] = pop_address
+        table[ADD], table[SUB], table[NEG] = add, sub, neg
+        table[EQ], table[GT], table[LT] = eq, gt, lt
+        table[AND], table[OR], table[NOT] = and_, or_, not_
+        table[GOTO], table[IF_GOTO], table[HALT] = goto, if_goto, halt
+        table[FUNCTION], table[CALL], table[RETURN], table[NATIVE] = function, call, return_, native
+
+        n = 0
+        try:
+            for n in range(steps):
+                op, x, y = code[pc]
+                pc += 1
+                table[op](x, y)
+            else:
+                n = steps
+        except Halt:
+            # stay on the halting instruction
+            pc -= 1
+            self.halted = True
+        self.pc = pc
+        ram[SP], ram[LCL], ram[ARG] = sp, lcl, arg
+        self.steps += n
+        return n
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    ram = {}
+    if '-ram' in args:
+        i = args.index('-ram')
+        ram = parse_ram(args[i + 1])
+        del args[i:i + 2]
+    interpreter = VMInterpreter(VMProgram(read_vm(args[0])))
+    for address, value in ram.items():
+        interpreter.ram[address] = value
+    start = time.perf_counter()
+    interpreter.run(int(args[1]) if len(args) > 1 else 10 ** 7)
+    elapsed = time.perf_counter() - start
+    sp = interpreter.ram[SP]
+    print('steps {s}  halted {h}  {r:,.0f} commands/s'.format(
+        s=interpreter.steps, h=interpreter.halted, r=interpreter.steps / max(elapsed, 1e-9)))
+    print('SP {s}  top {t}'.format(s=sp, t=interpreter.ram[sp - 1] if sp > STACK_BASE else None))